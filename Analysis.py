@@ -0,0 +1,176 @@
+import numpy as np
+import RunArchive, Stats
+
+FEATURES = ['Peak (a.u.)', 'Time to peak (s)', 'Area (a.u. s)', 'Decay rate (1/s)']
+QUALITY = ['Noise floor (a.u.)', 'Noise SD (a.u.)', 'SNR', 'LOD (a.u.)']
+STATISTICS = ['Mean', 'SD', 'CV (%)']
+OUTLIER_METHODS = {'none': 'None', 'mad': 'Median Absolute Deviation', 'grubbs': 'Grubbs'}
+
+
+def decay_rate(time, data, peak, tail=0.1):
+    """
+    First-order decay constant of every column: least-squares line through log(counts) after the peak, where
+    the counts are above `tail` x peak. The masked sums fit all columns at once; NaN where fewer than 3 points qualify.
+    """
+    y = np.asarray(data, dtype=np.float64)
+    rows = np.arange(len(y))[:, None]
+    mask = (rows > peak) & (y > tail * y[peak, np.arange(y.shape[1])]) & (y > 0)
+    x = np.where(mask, time[:, None], 0.0)
+    ly = np.where(mask, np.log(np.where(mask, y, 1.0)), 0.0)
+    n = mask.sum(axis=0)
+    sx, sy = x.sum(axis=0), ly.sum(axis=0)
+    sxx, sxy = (x * x).sum(axis=0), (x * ly).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+    return np.where(n >= 3, -slope, np.nan)
+
+
+def features(run):
+    """Per-sample kinetics of a RunIO.Run: peak, time-to-peak, trapezoidal area and decay rate, as {label: array}"""
+    if not len(run.time):
+        return {label: np.full(len(run.samples), np.nan) for label in FEATURES}
+    data = run.data
+    peak = data.argmax(axis=0)
+    return {'Peak (a.u.)': data[peak, np.arange(data.shape[1])],
+            'Time to peak (s)': run.time[peak],
+            'Area (a.u. s)': ((data[1:] + data[:-1]) * np.diff(run.time)[:, None]).sum(axis=0) / 2,
+            'Decay rate (1/s)': decay_rate(run.time, data, peak)}
+
+
+def quality(run, window=None, k=3.0):
+    """
+    Acquisition quality of every sample of a RunIO.Run: noise floor (mean of the quiet-time segment, `window` seconds
+    or the run's sqt, first tenth of the rows when shorter), high-frequency noise SD from the MAD of the first
+    differences (slow signal cancels out), SNR of the peak above the floor and the LOD signal, floor + k x noise SD.
+    """
+    if len(run.time) < 3:
+        return {label: np.full(len(run.samples), np.nan) for label in QUALITY}
+    data = run.data
+    if window is None:
+        window = float(run.meta.get('settings', {}).get('sqt', 0) or 0)
+    rows = int(np.searchsorted(run.time, run.time[0] + window)) if window else 0
+    rows = max(rows, min(max(len(run.time) // 10, 3), len(run.time)))
+    floor = data[:rows].mean(axis=0)
+    d = np.diff(data, axis=0)
+    noise = 1.4826 * np.median(np.abs(d - np.median(d, axis=0)), axis=0) / np.sqrt(2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        snr = (data.max(axis=0) - floor) / noise
+    return {'Noise floor (a.u.)': floor, 'Noise SD (a.u.)': noise, 'SNR': snr, 'LOD (a.u.)': floor + k * noise}
+
+
+def degraded(archive, min_snr=10.0):
+    """Archived runs with a scored sample below `min_snr`, (entry, lowest SNR) pairs, the worst first"""
+    found = []
+    for entry in archive.entries(lambda entry: 'quality' in entry and RunArchive.analysable(entry)):
+        snr = [v for v in entry['quality'].get('SNR', []) if v is not None]
+        if snr and min(snr) < min_snr:
+            found.append((entry, min(snr)))
+    return sorted(found, key=lambda pair: pair[1])
+
+
+def to_json(values):
+    """{label: array} -> {label: list} for the archive index, NaN becomes None"""
+    return {label: [None if np.isnan(v) else float(v) for v in np.asarray(value, dtype=np.float64)] for label, value in values.items()}
+
+
+def archive_features(archive, run_ids=None, progress_callback=None):
+    """
+    Computes and stores the features and quality scores of archived runs (the analysable ones unless `run_ids` is
+    given, see RunArchive.analysable), returns {id: features}
+    """
+    entries = archive.entries(lambda entry: RunArchive.analysable(entry, run_ids))
+    results, scores = {}, {}
+    for n, entry in enumerate(entries):
+        try:
+            run = archive.load(entry['id'])
+            run.meta.setdefault('settings', entry.get('settings', {}))
+            results[entry['id']] = to_json(features(run))
+            scores[entry['id']] = to_json(quality(run))
+        except Exception as e:
+            print(e)
+        if progress_callback:
+            progress_callback(round((n + 1) / len(entries) * 100))
+    archive.update_many({run_id: {'features': values, 'quality': scores[run_id]} for run_id, values in results.items()})
+    return results
+
+
+def outliers(values, method='mad', threshold=3.5, alpha=0.05):
+    """
+    Outlying replicates of every row of `values` (rows x replicates), as a boolean mask: modified z-score above
+    `threshold` (MAD, the mean absolute deviation where the MAD is 0) or repeated two-sided Grubbs tests at `alpha`,
+    each pass testing the remaining points of all rows.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    mask = ~np.isfinite(x)
+    if method == 'mad':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            median = np.nanmedian(x, axis=-1, keepdims=True)
+            deviation = np.abs(x - median)
+            mad = np.nanmedian(deviation, axis=-1, keepdims=True)
+            # Half the replicates equal (quantised counts): MAD is 0, the scaled mean absolute deviation is used instead
+            scale = np.where(mad > 0, mad / 0.6745, 1.253314 * np.nanmean(deviation, axis=-1, keepdims=True))
+            return mask | (deviation / scale > threshold)
+    if method == 'grubbs':
+        for _ in range(max(x.shape[-1] - 2, 0)):
+            n = (~mask).sum(axis=-1)
+            mean, sd, _ = _masked_moments(x, mask)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                deviation = np.where(mask, -np.inf, np.abs(x - mean[..., None]) / sd[..., None])
+            worst = deviation.argmax(axis=-1)
+            g = np.take_along_axis(deviation, worst[..., None], axis=-1)[..., 0]
+            t = Stats.t_quantile(n - 2, 1 - alpha / n)
+            critical = (n - 1) / np.sqrt(n) * np.sqrt(t * t / (n - 2 + t * t))
+            reject = (n > 2) & (g > critical)
+            if not reject.any():
+                break
+            np.put_along_axis(mask, worst[..., None], np.take_along_axis(mask, worst[..., None], axis=-1) | reject[..., None], axis=-1)
+    return mask
+
+
+def _masked_moments(x, mask):
+    """Mean, sample SD and count of the unmasked replicates of every row"""
+    n = (~mask).sum(axis=-1)
+    kept = np.where(mask, 0.0, x)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = kept.sum(axis=-1) / n
+        sd = np.sqrt(np.where(mask, 0.0, (x - mean[..., None]) ** 2).sum(axis=-1) / (n - 1))
+    return mean, sd, n
+
+
+def replicate_stats(values, method='none'):
+    """Mean, SD and CV of the replicates (columns) of every row once the outliers are rejected, and the outlier mask"""
+    x = np.asarray(values, dtype=np.float64)
+    mask = outliers(x, method)
+    mean, sd, _ = _masked_moments(x, mask)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {'Mean': mean, 'SD': sd, 'CV (%)': 100 * sd / np.abs(mean)}, mask
+
+
+def feature_stats(values, method='none'):
+    """Replicate statistics of every feature across the samples of a run: ({label: {statistic: value}}, {label: outlier mask})"""
+    labels = list(values)
+    stats, mask = replicate_stats(np.array([values[label] for label in labels], dtype=np.float64), method)
+    return ({label: {name: stats[name][i] for name in STATISTICS} for i, label in enumerate(labels)},
+            {label: mask[i] for i, label in enumerate(labels)})
+
+
+def envelope(run, method='none'):
+    """Replicate mean and SD of every time point of a RunIO.Run, as (time, columns lower/mean/upper)"""
+    stats, _ = replicate_stats(run.data, method)
+    mean, sd = stats['Mean'], stats['SD']
+    return run.time, np.column_stack([mean - sd, mean, mean + sd])
+
+
+class ReplicateStream:
+    """
+    Replicate envelope of streamed rows: the statistics of a time point only depend on its own row, so every push
+    computes the new rows alone and returns them as (t, columns lower/mean/upper), ready for a RingBuffer.
+    """
+    def __init__(self, method='none'):
+        self.method = method
+
+    def push(self, t, y):
+        t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        stats, _ = replicate_stats(np.asarray(y, dtype=np.float64).reshape(len(t), -1), self.method)
+        mean, sd = stats['Mean'], stats['SD']
+        return t, np.column_stack([mean - sd, mean, mean + sd])
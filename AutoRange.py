@@ -0,0 +1,76 @@
+import numpy as np
+import Analysis
+
+PV_RANGE = (20.0, 35.0)
+PV_STEP = 0.5
+# SiPM breakdown voltage (V) of the fitted detector, overridden by QSettings('AutoRange') Breakdown
+BREAKDOWN_V = 24.5
+GAINS = [1, 2, 64, 128]
+# ADC reference in the units the device reports (V), overridden by QSettings('AutoRange') FullScale
+FULL_SCALE = 5.0
+MIN_SNR = 10.0
+SATURATION = 0.95
+TARGET = 0.6
+PRESCAN_TIME = 2.0
+MAX_SCANS = 2
+
+
+def prescan_body(body, duration=PRESCAN_TIME):
+    """
+    Sampling command body of the short pre-acquisition: same samples and readout, no quiet time. The device reads the
+    samples one after another, so `duration` seconds are shared between them.
+    """
+    st = min(float(body['st']), duration / max(int(body['sn']), 1))
+    return dict(body, sqt=0.0, st=st, si=min(float(body['si']), st / 10), raw=False)
+
+
+def overvoltage(pv, breakdown=BREAKDOWN_V):
+    """SiPM gain is proportional to the voltage above breakdown"""
+    return np.maximum(np.asarray(pv, dtype=np.float64) - breakdown, 0.1)
+
+
+def full_scale(ag, reference=FULL_SCALE):
+    """Largest reading at an ADC gain: the device reports input-referred values, full scale is the reference over the gain"""
+    return reference / np.asarray(ag, dtype=np.float64)
+
+
+def choose(run, pv, ag, target=TARGET, reference=FULL_SCALE, min_snr=MIN_SNR, breakdown=BREAKDOWN_V):
+    """
+    Picks the SiPM voltage and ADC gain from a pre-acquisition. Readings are input-referred (the ADC gain is divided
+    out), so the peak scales with the overvoltage only while the full scale shrinks with the gain: the use of the
+    range, peak / full_scale(ag), is predicted for every (pv, ag) pair at once and only pairs under `target` qualify.
+    Among them the lowest voltage that still fills a quarter of the range with an expected SNR above `min_snr` wins
+    (SiPM dark counts grow with the voltage, the ADC gain fills the range), when none does the largest signal does.
+    A saturated pre-scan only bounds the response: the gain is cut at least 4 times and another pre-scan is asked for,
+    as it is when a noise-buried pre-scan (SNR < 3) leads to a setting far from the current one, or when the pre-scan
+    sat within a step of `breakdown` where the overvoltage model is too uncertain to move the voltage on.
+    Returns {'pv', 'ag', 'rescan', 'peak', 'predicted', 'snr'}, peak and predicted as fractions of the full scale.
+    """
+    peak = float(np.abs(run.data).max()) if run.data.size else 0.0
+    # No quiet time in a pre-scan: the SNR is the reading of each sample over its high-frequency noise
+    with np.errstate(invalid='ignore', divide='ignore'):
+        snr = np.abs(run.data).max(axis=0) / Analysis.quality(run)['Noise SD (a.u.)'] if run.data.size else np.array([np.nan])
+    snr = float(np.nanmin(snr)) if np.isfinite(snr).any() else float('nan')
+    used = float(peak / full_scale(ag, reference))
+    saturated = used >= SATURATION
+    response = max(peak, 1e-12) / overvoltage(pv, breakdown)
+    voltages = np.arange(max(PV_RANGE[0], breakdown + PV_STEP), PV_RANGE[1] + PV_STEP / 2, PV_STEP)
+    predicted = response * overvoltage(voltages, breakdown)[:, None] / full_scale(GAINS, reference)[None, :]
+    ok = predicted <= target
+    if saturated:
+        ok &= predicted <= used / 4
+    # Worst-case SNR of every voltage: the signal follows the overvoltage, the noise is taken as unchanged
+    expected = snr * overvoltage(voltages, breakdown)[:, None] / overvoltage(pv, breakdown)
+    usable = ok & (predicted >= target / 4) & (expected >= min_snr)
+    if not ok.any():
+        i, j = 0, 0
+    elif usable.any():
+        i = int(np.flatnonzero(usable.any(axis=1))[0])
+        j = int(np.where(usable[i], predicted[i], -np.inf).argmax())
+    else:
+        i, j = np.unravel_index(np.where(ok, predicted, -np.inf).argmax(), predicted.shape)
+    change = predicted[i, j] / used if used > 0 else np.inf
+    near_breakdown = pv < breakdown + PV_STEP and voltages[i] != pv
+    rescan = saturated or near_breakdown or (not snr >= 3 and not 0.25 <= change <= 4)
+    return {'pv': float(voltages[i]), 'ag': int(GAINS[j]), 'rescan': bool(rescan), 'peak': used,
+            'predicted': float(predicted[i, j]), 'snr': snr}
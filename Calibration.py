@@ -0,0 +1,119 @@
+import os, json, time, threading
+import numpy as np
+import Analysis, Fitting, References
+
+CALIBRATION_FILE = os.path.join(os.path.expanduser('~'), '.lucidsens', 'calibrations.json')
+
+
+def _linear(p, x):
+    a, b = p[:, 0:1], p[:, 1:2]
+    return a + b * x, np.stack([np.ones_like(x), x], axis=-1)
+
+
+def _5pl(p, x):
+    """y = d + (a - d) / (1 + (x/c)^b)^g, the 4PL being g = 1; model and Jacobian for Fitting.levenberg_marquardt"""
+    a, b, c, d = (p[:, i:i + 1] for i in range(4))
+    g = p[:, 4:5] if p.shape[1] > 4 else np.ones_like(a)
+    ratio = np.where(x > 0, x / c, 1.0)
+    u = np.where(x > 0, ratio ** b, 0.0)
+    log_ratio = np.where(x > 0, np.log(np.abs(ratio)), 0.0)
+    s = (1 + u) ** -g
+    ds = -(a - d) * g * (1 + u) ** (-g - 1) * u
+    columns = [s, ds * log_ratio, -ds * b / c, 1 - s]
+    if p.shape[1] > 4:
+        columns.append(-(a - d) * s * np.log1p(u))
+    return d + (a - d) * s, np.stack(columns, axis=-1)
+
+
+MODELS = {'linear': (('a', 'b'), _linear), '4PL': (('a', 'b', 'c', 'd'), _5pl), '5PL': (('a', 'b', 'c', 'd', 'g'), _5pl)}
+FEATURES = ['Peak (a.u.)', 'Area (a.u. s)']
+
+
+def fit_curve(x, y, model='4PL'):
+    """Fits a calibration curve to standards (concentration x, signal y), returns {'model', 'params', 'rss', 'n', 'range'}"""
+    names, function = MODELS[model]
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    if model == 'linear':
+        p0 = np.polyfit(x, y, 1)[::-1]
+    else:
+        positive = x[x > 0]
+        p0 = [y[0], 1.0, np.median(positive) if len(positive) else 1.0, y[-1]] + ([1.0] if model == '5PL' else [])
+    p, _, rss, converged = Fitting.levenberg_marquardt(function, x[None, :], y[None, :], np.ones((1, len(x))), np.array([p0]))
+    return {'model': model, 'params': dict(zip(names, p[0].tolist())), 'rss': float(rss[0]), 'n': int(len(x)),
+            'range': [float(x.min()), float(x.max())], 'converged': bool(converged[0])}
+
+
+def predict(fit, signal):
+    """
+    Concentrations of an array of signals through the inverted calibration curve, NaN where the concentration falls
+    outside the range of the standards: a calibration is never extrapolated.
+    """
+    y = np.asarray(signal, dtype=np.float64)
+    p = fit['params']
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        if fit['model'] == 'linear':
+            x = (y - p['a']) / p['b']
+        else:
+            g = p.get('g', 1.0)
+            x = p['c'] * (((p['a'] - p['d']) / (y - p['d'])) ** (1 / g) - 1) ** (1 / p['b'])
+        low, high = fit['range']
+        margin = 1e-9 * (high - low or 1.0)
+        return np.where((x >= low - margin) & (x <= high + margin), x, np.nan)
+
+
+class CalibrationStore:
+    """
+    Calibration curves per device and photodetection settings (same key as the blank references), kept in memory and
+    in one JSON file, so predicting the concentrations of a new run is a dictionary lookup and one vectorised call.
+    """
+    def __init__(self, path=CALIBRATION_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.curves = json.load(f)
+        except (OSError, ValueError):
+            self.curves = {}
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.curves, f, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+
+    def build(self, archive, device, settings, model='4PL', feature='Peak (a.u.)'):
+        """
+        Fits the curve of a key from every archived standard sharing it: runs whose entry lists 'concentrations' (one per
+        sample, None for the non-standards) and the stored features (computed when missing).
+        """
+        key = References.reference_key(device, settings)
+        x, y = [], []
+        for entry in archive.entries(lambda entry: entry.get('concentrations') and
+                                     References.reference_key(entry.get('device', ''), entry.get('settings', {})) == key):
+            values = entry.get('features', {}).get(feature)
+            if values is None:
+                values = Analysis.features(archive.load(entry['id']))[feature]
+            for concentration, value in zip(entry['concentrations'], values):
+                if concentration is not None and value is not None and np.isfinite(value):
+                    x.append(concentration)
+                    y.append(value)
+        if len(x) < len(MODELS[model][0]) + 1:
+            raise ValueError(f'{len(x)} standards found, the {model} curve needs at least {len(MODELS[model][0]) + 1}.')
+        fit = fit_curve(x, y, model)
+        fit.update(feature=feature, updated=time.time())
+        with self._lock:
+            self.curves[key] = fit
+            self._write()
+        return fit
+
+    def curve(self, device, settings):
+        return self.curves.get(References.reference_key(device, settings))
+
+    def predict(self, device, settings, features):
+        """Concentrations for a run's features ({label: array}, see Analysis.features), None without a curve"""
+        fit = self.curve(device, settings)
+        if fit is None:
+            return None
+        return predict(fit, features[fit['feature']])
@@ -0,0 +1,135 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import RunArchive, Stats
+
+
+def _exp(p, t):
+    """y = A exp(-k t) + c, returns the model and its Jacobian for every sample at once: (m, n) and (m, n, 3)"""
+    A, k, c = p[:, 0:1], p[:, 1:2], p[:, 2:3]
+    e = np.exp(-k * t)
+    return A * e + c, np.stack([e, -A * t * e, np.ones_like(e)], axis=-1)
+
+
+def _biexp(p, t):
+    """y = A1 exp(-k1 t) + A2 exp(-k2 t) + c"""
+    A1, k1, A2, k2, c = (p[:, i:i + 1] for i in range(5))
+    e1, e2 = np.exp(-k1 * t), np.exp(-k2 * t)
+    return A1 * e1 + A2 * e2 + c, np.stack([e1, -A1 * t * e1, e2, -A2 * t * e2, np.ones_like(e1)], axis=-1)
+
+
+MODELS = {'exp': (('A', 'k', 'c'), _exp), 'biexp': (('A1', 'k1', 'A2', 'k2', 'c'), _biexp)}
+
+
+def levenberg_marquardt(model, t, y, w, p0, iterations=200, tol=1e-10):
+    """
+    Batched Levenberg-Marquardt: fits one parameter vector per row of y (m samples x n points, weights/mask w) with a
+    vectorised residual and Jacobian, the m damped normal equations are solved together at every iteration.
+    Returns (params, JtJ, rss, converged).
+    """
+    with np.errstate(over='ignore', invalid='ignore'):
+        p = np.array(p0, dtype=np.float64)
+        f, J = model(p, t)
+        r = (y - f) * w
+        cost = (r * r).sum(axis=1)
+        lam = np.full(len(p), 1e-3)
+        active = np.isfinite(cost)
+        eye = np.eye(p.shape[1])
+        for _ in range(iterations):
+            if not active.any():
+                break
+            Jw = J * w[..., None]
+            A = np.einsum('mnp,mnq->mpq', Jw, Jw)
+            g = np.einsum('mnp,mn->mp', Jw, r)
+            damped = A + lam[:, None, None] * (A * eye + 1e-12 * eye)
+            try:
+                step = np.linalg.solve(damped, g[..., None])[..., 0]
+            except np.linalg.LinAlgError:
+                step = np.einsum('mpq,mq->mp', np.linalg.pinv(damped), g)
+            trial = p + step
+            f_new, J_new = model(trial, t)
+            r_new = (y - f_new) * w
+            cost_new = (r_new * r_new).sum(axis=1)
+            better = active & (cost_new < cost)
+            done = better & ((cost - cost_new <= tol * cost) | (np.abs(step) <= tol * (np.abs(p) + tol)).all(axis=1))
+            p[better], f[better], J[better], r[better] = trial[better], f_new[better], J_new[better], r_new[better]
+            cost = np.where(better, cost_new, cost)
+            lam = np.where(better, lam / 10, lam * 10)
+            active &= ~done & (lam < 1e12)
+        Jw = J * w[..., None]
+        return p, np.einsum('mnp,mnq->mpq', Jw, Jw), cost, ~active
+
+
+def _initial(model, t, y, w):
+    """Initial guesses from the data: offset from the tail, amplitude from the peak, rate from the 1/e crossing"""
+    m = len(y)
+    n = w.sum(axis=1)
+    c = np.array([y[i][w[i]][-max(int(n[i]) // 10, 1):].mean() if n[i] else 0.0 for i in range(m)])
+    A = np.array([y[i][w[i]][0] if n[i] else 1.0 for i in range(m)]) - c
+    span = np.array([t[i][w[i]][-1] if n[i] else 1.0 for i in range(m)])
+    below = np.where(w & ((y - c[:, None]) < A[:, None] / np.e), t, np.inf).min(axis=1)
+    k = 1.0 / np.where(np.isfinite(below) & (below > 0), below, np.maximum(span, 1e-9) / 3)
+    if model == 'exp':
+        return np.column_stack([A, k, c])
+    return np.column_stack([A / 2, 3 * k, A / 2, k / 3, c])
+
+
+def fit_run(run, model='exp', previous=None, level=0.95):
+    """
+    Fits a decay model to the part of every sample after its peak (time counted from the peak), all samples in one
+    batched Levenberg-Marquardt. `previous` fits of the same run/model (e.g. from the archive) are used as a warm start.
+    Returns one {'model', 'params', 'ci', 'rss', 'converged'} dict per sample, `ci` being the half-width at `level`.
+    """
+    names, function = MODELS[model]
+    if not len(run.time):
+        return []
+    y = run.data.T
+    peak = y.argmax(axis=1)
+    t = run.time[None, :] - run.time[peak][:, None]
+    w = t >= 0
+    t = np.where(w, t, 0.0)
+    if previous and len(previous) == len(y) and all(fit and fit.get('model') == model for fit in previous):
+        p0 = np.array([[fit['params'][name] for name in names] for fit in previous])
+    else:
+        p0 = _initial(model, t, y, w)
+    p, A, rss, converged = levenberg_marquardt(function, t, y, w.astype(np.float64), p0)
+    dof = w.sum(axis=1) - len(names)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = np.linalg.pinv(A) * (rss / np.maximum(dof, 1))[:, None, None]
+        ci = Stats.t_quantile(dof, level)[:, None] * np.sqrt(np.abs(np.diagonal(cov, axis1=1, axis2=2)))
+    return [{'model': model,
+             'params': {name: float(p[i, j]) for j, name in enumerate(names)},
+             'ci': {name: float(ci[i, j]) if dof[i] > 0 else None for j, name in enumerate(names)},
+             'rss': float(rss[i]),
+             'converged': bool(converged[i])} for i in range(len(y))]
+
+
+def _fit_archived(root, run_id, model, previous):
+    return run_id, fit_run(RunArchive.RunArchive(root).load(run_id), model, previous)
+
+
+def fit_archive(root=RunArchive.ARCHIVE_DIR, run_ids=None, model='exp', workers=None, progress_callback=None):
+    """
+    Fits archived runs (the analysable ones unless `run_ids` is given, see RunArchive.analysable) on a process pool,
+    one run per task, each warm started from the fits already stored in its index entry. The results are stored back
+    under entry['fits'][model].
+    """
+    archive = RunArchive.RunArchive(root)
+    entries = archive.entries(lambda entry: RunArchive.analysable(entry, run_ids))
+    done, results = 0, {}
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=ctx) as pool:
+        futures = [pool.submit(_fit_archived, root, entry['id'], model, entry.get('fits', {}).get(model)) for entry in entries]
+        for future in as_completed(futures):
+            done += 1
+            try:
+                run_id, fits = future.result()
+                results[run_id] = fits
+            except Exception as e:
+                print(e)
+            if progress_callback:
+                progress_callback(round(done / len(futures) * 100))
+    fits = {entry['id']: dict(entry.get('fits', {}), **{model: results[entry['id']]}) for entry in entries if entry['id'] in results}
+    archive.update_many({run_id: {'fits': value} for run_id, value in fits.items()})
+    return results
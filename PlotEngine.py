@@ -0,0 +1,280 @@
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtCore
+from PyQt5.QtCore import QSettings
+import RunIO
+
+COLORS = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'w', '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+
+def palette(n):
+    """Colours for n curves: the classic 18-colour list, evenly spaced hues beyond that"""
+    if n <= len(COLORS):
+        return COLORS[:n]
+    return [pg.intColor(i, hues=n) for i in range(n)]
+
+
+class CurveManager:
+    """
+    Owns the curves of a PlotItem: grid, legend and axis labels are set up once and every curve (one per slot) is
+    created once, later redraws only call setData on the existing items and are painted together on the next frame.
+    Legend entries are only added for the first `legend_limit` curves, show_legend() adds the rest on demand.
+    """
+    def __init__(self, plot, legend_offset=(548, 8), legend_limit=18):
+        self.plot_item = plot
+        self.items = {}
+        self.names = {}
+        self.colors = {}
+        self.legend_limit = legend_limit
+        self.plot_item.showGrid(x=True, y=True, alpha=1)
+        self.legend = self.plot_item.addLegend(offset=legend_offset)
+        self.style()
+
+    def style(self):
+        """Axis labels in the colour of the current theme"""
+        _theme = QSettings('Theme').value('Theme')
+        color = 'black' if _theme in ['Fusion', 'Light-Classic'] else 'white'
+        self.plot_item.setLabel('bottom', 'Time (s)', **{'color': color, 'font-size': '12px'})
+        self.plot_item.setLabel('left', 'Counts (a.u.)', **{'color': color, 'font-size': '12px'})
+
+    def plot(self, slot, x, y, color='w', title=None):
+        """Creates the curve of `slot` on first use, afterwards only updates its data (and its pen if the colour changed)"""
+        item = self.items.get(slot)
+        if item is None:
+            item = pg.PlotDataItem()
+            self.plot_item.addItem(item)
+            self.items[slot] = item
+            self.names[slot] = title or str(slot)
+            if len(self.items) <= self.legend_limit:
+                self.legend.addItem(item, self.names[slot])
+        if self.colors.get(slot) != color:
+            item.setPen(pg.mkPen(color=color, width=2))
+            self.colors[slot] = color
+        item.setData(x=np.asarray(x, dtype=np.float64), y=np.asarray(y, dtype=np.float64))
+        return item
+
+    def set_data(self, slot, x, y):
+        """Updates the data of an existing curve, unknown slots are ignored"""
+        if slot in self.items:
+            self.items[slot].setData(x=x, y=y)
+
+    def keep(self, slots):
+        """Removes the curves (and their legend entries) of every slot not in `slots`"""
+        for slot in [slot for slot in self.items if slot not in slots]:
+            self.legend.removeItem(self.items[slot])
+            self.plot_item.removeItem(self.items.pop(slot))
+            self.names.pop(slot, None)
+            self.colors.pop(slot, None)
+
+    def clear(self):
+        self.keep([])
+
+    def show_legend(self, everything=True):
+        """Lists every curve in the legend, or only the first `legend_limit` ones"""
+        self.legend.clear()
+        for n, (slot, item) in enumerate(self.items.items()):
+            if everything or n < self.legend_limit:
+                self.legend.addItem(item, self.names[slot])
+
+
+class SmallMultiples:
+    """
+    Grid of small plots with linked axes, one curve per slot, for runs with too many samples to overlay.
+    Same interface as CurveManager: `plot_item` is the top-left tile and every tile is fed from the same decimated view.
+    """
+    def __init__(self, layout, slots, cols=None):
+        self.slots = list(slots)
+        self.cols = cols or int(np.ceil(np.sqrt(len(self.slots) * 1.5)))
+        rows = int(np.ceil(len(self.slots) / self.cols))
+        self.tiles, self.items, self.colors = {}, {}, {}
+        for n, slot in enumerate(self.slots):
+            tile = layout.addPlot(row=n // self.cols, col=n % self.cols)
+            tile.setTitle(str(slot), size='8pt')
+            tile.hideButtons()
+            tile.showGrid(x=True, y=True, alpha=0.5)
+            tile.showAxis('left', n % self.cols == 0)
+            tile.showAxis('bottom', n // self.cols == rows - 1)
+            if n:
+                tile.setXLink(self.plot_item)
+                tile.setYLink(self.plot_item)
+            else:
+                self.plot_item = tile
+            self.tiles[slot] = tile
+
+    def style(self):
+        pass
+
+    def plot(self, slot, x, y, color='w', title=None):
+        """Creates the curve of the tile of `slot` on first use, afterwards only updates its data"""
+        if slot not in self.tiles:
+            return None
+        item = self.items.get(slot)
+        if item is None:
+            item = self.items[slot] = self.tiles[slot].plot()
+        if self.colors.get(slot) != color:
+            item.setPen(pg.mkPen(color=color, width=1))
+            self.colors[slot] = color
+        item.setData(x=np.asarray(x, dtype=np.float64), y=np.asarray(y, dtype=np.float64))
+        return item
+
+    def set_data(self, slot, x, y):
+        if slot in self.items:
+            self.items[slot].setData(x=x, y=y)
+
+    def keep(self, slots):
+        """Empties the tiles of every slot not in `slots`, the grid itself is fixed"""
+        for slot in [slot for slot in self.items if slot not in slots]:
+            self.tiles[slot].removeItem(self.items.pop(slot))
+            self.colors.pop(slot, None)
+
+    def clear(self):
+        self.keep([])
+
+    def show_legend(self, everything=True):
+        pass
+
+
+class Envelope:
+    """Replicate mean curve over a filled mean \u00b1 SD band, the items are created once and only updated by set_data()"""
+    def __init__(self, plot, color=(150, 150, 150)):
+        self.plot_item = plot
+        self.lower = pg.PlotDataItem(pen=pg.mkPen(color=color, width=1))
+        self.upper = pg.PlotDataItem(pen=pg.mkPen(color=color, width=1))
+        self.mean = pg.PlotDataItem(pen=pg.mkPen(color=color, width=2, style=QtCore.Qt.DashLine))
+        self.fill = pg.FillBetweenItem(self.lower, self.upper, brush=pg.mkBrush(*color, 60))
+        for item in (self.fill, self.lower, self.upper, self.mean):
+            self.plot_item.addItem(item)
+
+    def set_data(self, t, y):
+        """`y` columns are the lower bound, the mean and the upper bound"""
+        self.lower.setData(x=t, y=y[:, 0])
+        self.mean.setData(x=t, y=y[:, 1])
+        self.upper.setData(x=t, y=y[:, 2])
+
+    def remove(self):
+        for item in (self.fill, self.lower, self.upper, self.mean):
+            self.plot_item.removeItem(item)
+
+
+def heatmap(plot, xs, ys, values, x_label='', y_label='', title=''):
+    """Draws a (len(ys) x len(xs)) parameter grid on a PlotItem, one labelled cell per value pair, with a colour bar"""
+    plot.clear()
+    image = pg.ImageItem(np.asarray(values, dtype=np.float64).T)
+    plot.addItem(image)
+    finite = np.asarray(values, dtype=np.float64)[np.isfinite(values)]
+    levels = (finite.min(), finite.max() if finite.max() > finite.min() else finite.min() + 1) if finite.size else (0, 1)
+    image.setLevels(levels)
+    plot.getAxis('bottom').setTicks([[(i + 0.5, f'{v:g}') for i, v in enumerate(xs)]])
+    plot.getAxis('left').setTicks([[(i + 0.5, f'{v:g}') for i, v in enumerate(ys)]])
+    plot.setLabel('bottom', x_label)
+    plot.setLabel('left', y_label)
+    plot.setTitle(title)
+    bar = pg.ColorBarItem(values=levels, cmap=pg.colormap.get('viridis'))
+    bar.setImageItem(image, insert_in=plot)
+    return image
+
+
+class RingBuffer:
+    """Fixed-capacity (time x channels) buffer, appending overwrites the oldest rows and never allocates"""
+    def __init__(self, capacity, channels):
+        self.capacity = capacity
+        self.t = np.zeros(capacity)
+        self.y = np.zeros((capacity, channels))
+        self.count = 0
+
+    def extend(self, t, y, on_full=None):
+        """Appends rows, `on_full(t, y)` receives every complete segment of `capacity` rows before it is overwritten"""
+        t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        y = np.asarray(y, dtype=np.float64).reshape(len(t), self.y.shape[1])
+        pos = 0
+        while pos < len(t):
+            head = self.count % self.capacity
+            if not head and self.count and on_full:
+                on_full(self.t.copy(), self.y.copy())
+            k = min(len(t) - pos, self.capacity - head)
+            self.t[head:head + k] = t[pos:pos + k]
+            self.y[head:head + k] = y[pos:pos + k]
+            self.count += k
+            pos += k
+
+    def ordered(self):
+        """Buffered rows in chronological order"""
+        if self.count <= self.capacity:
+            return self.t[:self.count], self.y[:self.count]
+        head = self.count % self.capacity
+        return np.concatenate((self.t[head:], self.t[:head])), np.concatenate((self.y[head:], self.y[:head]))
+
+    def window(self, span):
+        """Rows of the last `span` seconds"""
+        t, y = self.ordered()
+        if not len(t):
+            return t, y
+        i = np.searchsorted(t, t[-1] - span)
+        return t[i:], y[i:]
+
+    def tail(self):
+        """Rows not handed to on_full yet"""
+        head = self.count % self.capacity
+        if self.count and not head:
+            head = self.capacity
+        return self.t[:head].copy(), self.y[:head].copy()
+
+
+class LiveView:
+    """
+    Scrolling real-time view: rows go into a RingBuffer and a QTimer redraws the last `window` seconds at most `fps`
+    times per second, so memory and redraw cost stay constant however long the monitoring lasts. Complete segments
+    leaving the buffer (and the remainder on stop) are handed to `on_full`, e.g. the archive. With a `stream` filter
+    (e.g. Processing.TriangularStream) the curves show its output while the raw rows are still the ones archived.
+    A `replicates` stream (e.g. Analysis.ReplicateStream) adds a mean \u00b1 SD envelope fed with the shown rows only.
+    """
+    def __init__(self, curves, samples, capacity=100000, window=60.0, fps=20, on_full=None, stream=None, replicates=None):
+        self.curves = curves
+        self.samples = list(samples)
+        self.window = window
+        self.on_full = on_full
+        self.buffer = RingBuffer(capacity, len(self.samples))
+        self.stream = stream
+        self.shown = RingBuffer(capacity, len(self.samples)) if stream is not None else self.buffer
+        self.replicates = replicates
+        self.band = RingBuffer(capacity, 3) if replicates is not None else None
+        self.envelope = Envelope(self.curves.plot_item) if replicates is not None else None
+        self._dirty = False
+        self.curves.keep(self.samples)
+        colors = palette(len(self.samples))
+        for i, sample in enumerate(self.samples):
+            self.curves.plot(sample, [], [], color=colors[i], title=sample)
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.redraw)
+        self.timer.start(int(1000 / fps))
+
+    def append(self, t, y):
+        """Pushes one or more rows, drawing happens on the next timer tick"""
+        self.buffer.extend(t, y, self.on_full)
+        if self.stream is not None:
+            t, y = self.stream.push(t, y)
+            self.shown.extend(t, y)
+        if self.replicates is not None and np.size(t):
+            self.band.extend(*self.replicates.push(t, y))
+        self._dirty = True
+
+    def redraw(self):
+        if not self._dirty:
+            return
+        t, y = self.shown.window(self.window)
+        if len(t):
+            t, y = RunIO.minmax_decimate(t, y, max(int(self.curves.plot_item.vb.width()), 100))
+            for i, sample in enumerate(self.samples):
+                self.curves.set_data(sample, t, y[:, i])
+            if self.envelope is not None:
+                self.envelope.set_data(*RunIO.minmax_decimate(*self.band.window(self.window), max(int(self.curves.plot_item.vb.width()), 100)))
+            self.curves.plot_item.setXRange(t[-1] - self.window, t[-1], padding=0)
+        self._dirty = False
+
+    def stop(self):
+        """Stops redrawing and flushes the rows still in the buffer to `on_full`"""
+        self.timer.stop()
+        if self.on_full:
+            t, y = self.buffer.tail()
+            if len(t):
+                self.on_full(t, y)
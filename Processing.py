@@ -0,0 +1,383 @@
+import base64, functools, threading
+from collections import OrderedDict
+import numpy as np
+import RunIO
+
+SG_WINDOW = 11
+BLOCK_ROWS = 8192
+
+
+@functools.lru_cache(maxsize=64)
+def savgol_coeffs(window, order):
+    """
+    Savitzky-Golay projection matrix of a window: row j holds the weights giving the least-squares polynomial fit at
+    offset j, the middle row is the convolution kernel and the outer rows smooth the edges of the series.
+    """
+    half = window // 2
+    A = np.vander(np.arange(-half, half + 1, dtype=np.float64), order + 1, increasing=True)
+    proj = A @ np.linalg.pinv(A)
+    proj.flags.writeable = False
+    return proj
+
+
+def _correlate(y, kernel):
+    """'valid' correlation of every column with a short kernel, done tap by tap on cache-sized blocks of rows"""
+    m, w = len(y) - len(kernel) + 1, len(kernel)
+    out = np.empty((m,) + y.shape[1:])
+    tmp = np.empty((min(BLOCK_ROWS, m),) + y.shape[1:])
+    for start in range(0, m, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, m)
+        block, term = out[start:stop], tmp[:stop - start]
+        np.multiply(y[start:stop], kernel[0], out=block)
+        for k in range(1, w):
+            np.multiply(y[start + k:stop + k], kernel[k], out=term)
+            block += term
+    return out
+
+
+def savgol(y, order, window=SG_WINDOW):
+    """Savitzky-Golay smoothing along the time axis of a (time x samples) matrix, every column in the same pass"""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    window = max(window, order + 1 + order % 2)
+    if n < window:
+        window = n - 1 + n % 2
+    if window <= order:
+        return y.copy()
+    proj = savgol_coeffs(window, order)
+    half = window // 2
+    out = np.empty_like(y)
+    out[half:n - half] = _correlate(y, proj[half])
+    out[:half] = np.tensordot(proj[:half], y[:window], axes=1)
+    out[n - half:] = np.tensordot(proj[half + 1:], y[n - window:], axes=1)
+    return out
+
+
+def _boxcar(y, half):
+    """Centred moving average of width 2*half+1 from one cumulative sum, the window shrinks at the edges"""
+    n, w = len(y), 2 * half + 1
+    c = np.zeros((n + 1,) + y.shape[1:])
+    np.cumsum(y, axis=0, out=c[1:])
+    out = np.empty_like(y)
+    if n >= w:
+        np.subtract(c[w:], c[:-w], out=out[half:n - half])
+        out[half:n - half] /= w
+    edges = np.concatenate((np.arange(min(half, n)), np.arange(max(n - half, min(half, n)), n)))
+    lo, hi = np.maximum(edges - half, 0), np.minimum(edges + half + 1, n)
+    out[edges] = (c[hi] - c[lo]) / (hi - lo).reshape((-1,) + (1,) * (y.ndim - 1))
+    return out
+
+
+def triangular(y, order):
+    """
+    Triangular moving average as two chained boxcars of half-width `order` (a triangle of 4*order+1 points), each one a
+    difference of cumulative sums: O(n) per column whatever the width. The first row is taken out first so the
+    running sums of long series keep their precision.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if not len(y):
+        return y.copy()
+    offset = y[0].copy()
+    return _boxcar(_boxcar(y - offset, order), order) + offset
+
+
+class TriangularStream:
+    """
+    Streaming triangular moving average for live acquisition: the two boxcars run causally on every pushed block with
+    their last rows carried over, so each row costs O(1). Output rows are centred, i.e. they lag the input by
+    2*order rows and carry the matching (earlier) time stamps.
+    """
+    def __init__(self, order, channels):
+        self.order = int(order)
+        self.width = 2 * self.order + 1
+        self.channels = channels
+        self.raw_tail = None
+        self.box_tail = None
+        self.t_tail = np.empty(0)
+
+    def _stage(self, tail, y):
+        ext = np.concatenate((tail, y))
+        c = np.zeros((len(ext) + 1, self.channels))
+        np.cumsum(ext, axis=0, out=c[1:])
+        return (c[self.width:] - c[:-self.width]) / self.width, ext[len(ext) - self.width + 1:]
+
+    def push(self, t, y):
+        """Feeds rows (time, one value per channel), returns the smoothed rows that are complete so far"""
+        t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        y = np.asarray(y, dtype=np.float64).reshape(len(t), self.channels)
+        if not len(t):
+            return t, y
+        if self.raw_tail is None:
+            self.raw_tail = np.repeat(y[:1], self.width - 1, axis=0)
+            self.box_tail = self.raw_tail.copy()
+        box, self.raw_tail = self._stage(self.raw_tail, y)
+        tri, self.box_tail = self._stage(self.box_tail, box)
+        pending = np.concatenate((self.t_tail, t))
+        k = max(len(pending) - 2 * self.order, 0)
+        self.t_tail = pending[k:]
+        return pending[:k], tri[len(tri) - k:]
+
+
+ALGORITHMS = {'Savitzky-Golay': savgol, 'Trianagular Moving Ave.': triangular}
+
+
+def smooth(y, algorithm, order):
+    """
+    Applies a smoothing algorithm of the Data Smoothing panel (name as in comboBox_Smt) to a (time x samples) matrix,
+    `order` is the polynomial order for Savitzky-Golay and the boxcar half-width for the triangular moving average.
+    """
+    return ALGORITHMS[algorithm](y, int(order))
+
+
+def baseline_poly(time, y, degree=1, window=None, iterations=50):
+    """
+    Polynomial baseline of every column, one least-squares projection for all of them: fitted to the pre-signal rows
+    (time < start + `window`) when a window is given, otherwise to the whole run while clipping the data to the fit
+    plus one residual deviation at every iteration (improved modified polyfit) so the peaks drop out.
+    """
+    time, y = np.asarray(time, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if not len(time):
+        return y.copy()
+    span = (time[-1] - time[0]) or 1.0
+    A = np.vander((time - time[0]) / span, degree + 1, increasing=True)
+    rows = time < time[0] + window if window else np.ones(len(time), dtype=bool)
+    if rows.sum() <= degree:
+        rows[:degree + 1] = True
+    if window:
+        return A @ np.linalg.lstsq(A[rows], y[rows], rcond=None)[0]
+    pinv = np.linalg.pinv(A)
+    target, coef = y.copy(), None
+    for _ in range(iterations):
+        previous, coef = coef, pinv @ target
+        if previous is not None and np.allclose(coef, previous, rtol=1e-6, atol=1e-9):
+            break
+        base = A @ coef
+        np.minimum(target, base + (target - base).std(axis=0), out=target)
+    return A @ coef
+
+
+def _second_difference_bands(n):
+    """Upper band storage of D'D for the second-difference matrix D, as expected by scipy.linalg.solveh_banded"""
+    c = np.array([1.0, -2.0, 1.0])
+    ab = np.zeros((3, n))
+    for k in range(3):
+        ab[2, k:n - 2 + k] += c[k] * c[k]
+    for k in range(2):
+        ab[1, k + 1:n - 1 + k] += c[k] * c[k + 1]
+    ab[0, 2:] += c[0] * c[2]
+    return ab
+
+
+def baseline_als(y, lam=1e6, p=0.01, iterations=10):
+    """
+    Asymmetric least squares baseline (Eilers): a smooth curve pulled below the signal by weighting the points above it
+    with `p`. `lam` is the stiffness of a 100-point run, scaled by (n/100)^4 (up to 1e14, beyond which the solve loses
+    precision) so the baseline does not depend on the sampling rate. The system (W + lam D'D) is pentadiagonal, so each
+    iteration is one O(n) banded Cholesky solve.
+    """
+    from scipy.linalg import solveh_banded
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) < 3:
+        return np.broadcast_to(y.min(axis=0), y.shape).copy()
+    bands = min(lam * (len(y) / 100) ** 4, 1e14) * _second_difference_bands(len(y))
+    base = np.empty_like(y)
+    for col in range(y.shape[1]):
+        w = np.ones(len(y))
+        for _ in range(iterations):
+            ab = bands.copy()
+            ab[2] += w
+            z = solveh_banded(ab, w * y[:, col])
+            w = np.where(y[:, col] > z, p, 1 - p)
+        base[:, col] = z
+    return base
+
+
+BASELINES = {'poly': 'Polynomial', 'als': 'Asymmetric Least Squares'}
+
+
+def baseline(time, y, method, param=None, window=None):
+    """Baseline of a (time x samples) matrix, `param` is the polynomial degree ('poly') or the smoothness lambda ('als')"""
+    if method == 'poly':
+        return baseline_poly(time, y, int(param if param is not None else 1), window)
+    return baseline_als(y, float(param if param is not None else 1e6))
+
+
+def unpack_reads(blob):
+    """
+    Raw ADS1232 reads of one sample as streamed in raw mode: base64 of 24-bit little-endian two's complement words
+    (3 bytes per read), or a plain list/array of integers. Returns int32 counts.
+    """
+    if isinstance(blob, (str, bytes)):
+        b = np.frombuffer(base64.b64decode(blob), dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        return ((b[:, 0] | b[:, 1] << 8 | b[:, 2] << 16) ^ 0x800000) - 0x800000
+    return np.asarray(blob, dtype=np.int32)
+
+
+def pack_reads(reads):
+    """Inverse of unpack_reads, e.g. for a device simulator"""
+    words = np.asarray(reads, dtype=np.int32).astype('<u4') & 0xFFFFFF
+    return base64.b64encode(words.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()).decode()
+
+
+@functools.lru_cache(maxsize=16)
+def _lowpass(factor):
+    """Hamming-windowed sinc low-pass with its cut-off at the Nyquist frequency of the decimated series"""
+    k = np.arange(-2 * factor, 2 * factor + 1)
+    h = np.sinc(k / factor) * np.hamming(len(k))
+    h = h / h.sum()
+    h.flags.writeable = False
+    return h
+
+
+def decimate_reads(reads, factor, method='mean'):
+    """
+    Reduces (reads x samples) raw counts to one point per `factor` reads, the way the firmware's r2avg did but on the
+    host: 'mean' and 'median' of every block of reads, or 'decimate' (low-pass filter evaluated at the block centres only).
+    """
+    reads = np.asarray(reads, dtype=np.float64)
+    factor = max(int(factor), 1)
+    n = len(reads) // factor * factor
+    blocks = reads[:n].reshape(n // factor, factor, reads.shape[1])
+    if method == 'median':
+        return np.median(blocks, axis=1)
+    if method == 'decimate' and factor > 1 and n:
+        h = _lowpass(factor)
+        padded = np.pad(reads[:n], ((len(h) // 2, len(h) // 2), (0, 0)), mode='edge')
+        out = np.zeros((n // factor, reads.shape[1]))
+        for k, weight in enumerate(h):
+            out += weight * padded[factor // 2 + k:factor // 2 + k + n:factor]
+        return out
+    return blocks.mean(axis=1)
+
+
+RAW_FILTERS = {'mean': 'Average', 'median': 'Median', 'decimate': 'Decimation Filter'}
+
+
+def rederive(raw_run, factor, method='mean'):
+    """Re-derives a run from its archived raw reads with another number of reads per point and/or another filter"""
+    factor = max(int(factor), 1)
+    data = decimate_reads(raw_run.data, factor, method)
+    meta = dict(raw_run.meta, raw_filter={'method': method, 'r2avg': factor})
+    return RunIO.Run(raw_run.time[::factor][:len(data)], data, raw_run.samples, raw_run.path, meta)
+
+
+def fingerprint(run):
+    """
+    Cache key of a run's data: the run's identity and its edit count (see RunIO.Run), never its bytes, so a
+    memory-mapped multi-GB run is not read again each time a processing setting changes
+    """
+    return run.token, run.edits
+
+
+def _nbytes(value, seen=None):
+    """Memory held by the arrays of a result (arrays shared between results are counted for each of them)"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(v, seen) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v, seen) for v in value)
+    if hasattr(value, '__dict__'):
+        return _nbytes(vars(value), seen)
+    return 0
+
+
+class ResultCache:
+    """
+    Memoised processing results keyed by (run fingerprint, algorithm, parameters...), least recently used ones are
+    evicted beyond `budget_mb`. One process-wide instance (RESULTS) serves the plot, the batch view and the reports.
+    """
+    def __init__(self, budget_mb=256):
+        self.budget = budget_mb * 1024 ** 2
+        self.nbytes = 0
+        self.hits, self.misses = 0, 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+        return value
+
+    def compute(self, key, function, *args):
+        """Returns the cached result of `key`, or computes it with function(*args) and caches it"""
+        value = self.get(key)
+        return value if value is not None else self.put(key, function(*args))
+
+    def set_budget(self, budget_mb):
+        with self._lock:
+            self.budget = budget_mb * 1024 ** 2
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        while self.nbytes > self.budget and len(self._items) > 1:
+            self.nbytes -= self._items.popitem(last=False)[1][1]
+
+
+RESULTS = ResultCache()
+
+
+def _smooth(run, algorithm, order):
+    meta = dict(run.meta, processing=run.meta.get('processing', []) + [('smooth', algorithm, int(order))])
+    return RunIO.Run(run.time, smooth(run.data, algorithm, order), run.samples, run.path, meta)
+
+
+def _baseline(run, method, param=None, window=None):
+    """Subtracts the baseline, a window of None is the sampling quiet time (sqt) of the run's settings"""
+    if window is None:
+        window = float(run.meta.get('settings', {}).get('sqt', 0))
+    meta = dict(run.meta, processing=run.meta.get('processing', []) + [('baseline', method, param, window)])
+    return RunIO.Run(run.time, run.data - baseline(run.time, run.data, method, param, window), run.samples, run.path, meta)
+
+
+STAGES = {'baseline': _baseline, 'smooth': _smooth}
+
+
+def _process(run, steps, cache):
+    key = (fingerprint(run),) if cache is not None else None
+    for stage, params in steps:
+        if cache is None:
+            run = STAGES[stage](run, *params)
+            continue
+        key += ((stage,) + tuple(params),)
+        run = cache.compute(key, STAGES[stage], run, *params)
+    return run, key
+
+
+def process(run, steps, cache=RESULTS):
+    """
+    Runs the processing steps, e.g. [('baseline', ('poly', 1, None)), ('smooth', ('Savitzky-Golay', 3))], on a RunIO.Run.
+    Every intermediate result is memoised under (run fingerprint, steps so far), so changing the last step
+    reuses the earlier ones and a step is never computed twice for the same data.
+    """
+    return _process(run, steps, cache)[0] if steps else run
+
+
+def process_view(run, steps, cache=RESULTS):
+    """RunIO.RunView of the processed run, its min/max pyramid is memoised along with the processed data"""
+    processed, key = _process(run, steps, cache)
+    return cache.compute(key + ('view',), RunIO.RunView, processed)
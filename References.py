@@ -0,0 +1,94 @@
+import os, json, time, hashlib, threading
+import numpy as np
+import RunIO
+
+REFERENCE_DIR = os.path.join(os.path.expanduser('~'), '.lucidsens', 'references')
+KEY_SETTINGS = ['pv', 'ag', 'as', 'pmr']
+
+
+def reference_key(device, settings):
+    """Blank references are shared by the runs of one device at the same PMV voltage, ADC gain/speed and read mode"""
+    return json.dumps([device or ''] + [settings.get(name) for name in KEY_SETTINGS])
+
+
+class ReferenceStore:
+    """
+    Blank/dark-count reference profiles: every blank run recorded for a key (see reference_key) is folded into a running
+    average that is stored precomputed as a .npy file, so looking up and subtracting the reference at acquisition time
+    is one dictionary access and one array subtraction. Profiles are loaded once and dropped when a new blank arrives.
+    """
+    def __init__(self, root=REFERENCE_DIR):
+        self.root = root
+        self._profiles = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.root, 'index.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        path = os.path.join(self.root, 'index.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def add(self, run, device, settings):
+        """Folds a blank run into the averaged reference of its key, a blank of another shape starts a new average"""
+        key = reference_key(device, settings)
+        with self._lock:
+            index = self._read_index()
+            entry = index.get(key)
+            profile = self.profile(device, settings)
+            if entry is None or profile is None or profile.shape != run.data.shape:
+                count, profile = 1, np.array(run.data, dtype=np.float64)
+            else:
+                count = entry['count'] + 1
+                profile = profile + (run.data - profile) / count
+            np.save(self._file(key), profile)
+            index[key] = {'device': device or '', 'settings': {name: settings.get(name) for name in KEY_SETTINGS},
+                          'count': count, 'rows': len(run.time), 'samples': run.samples, 'updated': time.time()}
+            self._write_index(index)
+            self._profiles[key] = profile
+        return count
+
+    def profile(self, device, settings):
+        """Averaged reference of a key, None when no blank was recorded for it"""
+        key = reference_key(device, settings)
+        if key not in self._profiles:
+            try:
+                self._profiles[key] = np.load(self._file(key))
+            except OSError:
+                return None
+        return self._profiles[key]
+
+    def offset(self, device, settings, shape):
+        """
+        Dark offset for data of `shape`: the whole profile when the blank has the same shape, otherwise its mean per
+        sample (or overall when the sample count differs too), None without a reference
+        """
+        profile = self.profile(device, settings)
+        if profile is None:
+            return None
+        if profile.shape == tuple(shape):
+            return profile
+        if profile.shape[1:] == tuple(shape[1:]):
+            return profile.mean(axis=0)
+        return profile.mean()
+
+    def subtract(self, run, device, settings):
+        """Blank-corrected copy of a RunIO.Run, the run itself when there is no reference for its settings"""
+        offset = self.offset(device, settings, run.data.shape)
+        if offset is None:
+            return run
+        meta = dict(run.meta, blank=reference_key(device, settings))
+        return RunIO.Run(run.time, run.data - offset, run.samples, run.path, meta)
+
+    def entries(self):
+        return self._read_index()
@@ -0,0 +1,130 @@
+import os, sys, time, argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import RunIO, RunArchive, Processing, Analysis
+
+# Per-process figure, created once by the pool initializer (or on first use) and cleared between reports
+_FIGURE = None
+
+
+def _figure():
+    global _FIGURE
+    if _FIGURE is None:
+        _FIGURE = Figure(figsize=(8.27, 11.69), dpi=100)
+        FigureCanvasAgg(_FIGURE)
+        _FIGURE.add_subplot(2, 1, 1)
+        _FIGURE.add_subplot(2, 1, 2)
+    return _FIGURE
+
+
+def _init_worker():
+    """Pool initializer: builds the figure and renders once so the fonts are loaded before the first report"""
+    fig = _figure()
+    fig.axes[0].set_title('LucidSens')
+    fig.canvas.draw()
+
+
+def summary(run):
+    """Per-sample summary metrics: the kinetics features of Analysis.features"""
+    return Analysis.features(run) if len(run.time) else {}
+
+
+def render_report(run, out_path, settings=None, metrics=None, steps=None):
+    """
+    Renders the plot, the acquisition parameters and the summary metrics of a RunIO.Run into a PNG or PDF file,
+    `steps` are optional processing steps (see Processing.process) applied first.
+    """
+    if steps:
+        run = Processing.process(run, steps)
+    fig = _figure()
+    plot_ax, table_ax = fig.axes
+    plot_ax.clear()
+    table_ax.clear()
+    t, y = RunIO.minmax_decimate(run.time, run.data, 2000)
+    for i, sample in enumerate(run.samples):
+        plot_ax.plot(t, y[:, i], linewidth=1, label=sample)
+    plot_ax.set_title(run.name)
+    plot_ax.set_xlabel('Time (s)')
+    plot_ax.set_ylabel('Counts (a.u.)')
+    plot_ax.grid(True, alpha=0.3)
+    if run.samples:
+        plot_ax.legend(fontsize='small', ncol=max(1, len(run.samples) // 6))
+
+    table_ax.axis('off')
+    settings = settings if settings is not None else run.meta.get('settings', {})
+    if settings:
+        table = table_ax.table(cellText=[[key, str(value)] for key, value in settings.items()], colLabels=['Parameter', 'Value'],
+                               bbox=[0.0, 0.55, 0.45, 0.45])
+        table.auto_set_font_size(False)
+        table.set_fontsize(8)
+    metrics = metrics if metrics is not None else summary(run)
+    if metrics:
+        rows = [[sample] + [f'{values[i]:.4g}' for values in metrics.values()] for i, sample in enumerate(run.samples)]
+        table = table_ax.table(cellText=rows, colLabels=['Sample'] + list(metrics), bbox=[0.5, 0.0, 0.5, 1.0] if settings else [0.0, 0.0, 1.0, 1.0])
+        table.auto_set_font_size(False)
+        table.set_fontsize(8)
+    fig.savefig(out_path)
+    return out_path
+
+
+def _render_archived(root, run_id, settings, out_dir, fmt, steps=None):
+    run = RunArchive.RunArchive(root).load(run_id)
+    run.meta.setdefault('settings', settings or {})
+    return render_report(run, os.path.join(out_dir, f'{run_id}.{fmt}'), settings, steps=steps)
+
+
+def _render_csv(path, out_dir, fmt, steps=None):
+    return render_report(RunIO.read_run(path), os.path.join(out_dir, f'{os.path.splitext(os.path.basename(path))[0]}.{fmt}'), steps=steps)
+
+
+def render_many(jobs, workers=None, progress_callback=None):
+    """Runs (function, args) report jobs on a process pool, one reused figure per worker; returns the written paths"""
+    done, written = 0, []
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        futures = [pool.submit(function, *args) for function, args in jobs]
+        for future in as_completed(futures):
+            done += 1
+            try:
+                written.append(future.result())
+            except Exception as e:
+                print(e)
+            if progress_callback:
+                progress_callback(round(done / len(futures) * 100))
+    return written
+
+
+def render_archive(out_dir, root=RunArchive.ARCHIVE_DIR, run_ids=None, fmt='png', workers=None, progress_callback=None, steps=None):
+    """Renders one report per archived run (the analysable ones unless `run_ids` is given, see RunArchive.analysable)"""
+    os.makedirs(out_dir, exist_ok=True)
+    entries = RunArchive.RunArchive(root).entries(lambda entry: RunArchive.analysable(entry, run_ids))
+    jobs = [(_render_archived, (root, entry['id'], entry.get('settings'), out_dir, fmt, steps)) for entry in entries]
+    return render_many(jobs, workers, progress_callback)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Renders LucidSens run reports (PNG/PDF) without a display.')
+    parser.add_argument('files', nargs='*', help='CSV run files, the archive is used when none is given')
+    parser.add_argument('-a', '--archive', default=RunArchive.ARCHIVE_DIR, help='archive directory')
+    parser.add_argument('-i', '--ids', nargs='*', help='archived run ids, default: every acquired run (no blanks, raw reads or live segments)')
+    parser.add_argument('-o', '--out', default='reports', help='output directory')
+    parser.add_argument('-f', '--format', default='png', choices=['png', 'pdf'])
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes, default: CPU count')
+    parser.add_argument('-b', '--baseline', choices=list(Processing.BASELINES), default=None,
+                        help='subtract a baseline first, fitted to the sampling quiet time when the run has one')
+    parser.add_argument('-s', '--smooth', nargs=2, metavar=('ALGORITHM', 'ORDER'), default=None,
+                        help=f'smooth the data, algorithm: {", ".join(repr(name) for name in Processing.ALGORITHMS)}')
+    args = parser.parse_args()
+    steps = ([('baseline', (args.baseline, None, None))] if args.baseline else []) + \
+            ([('smooth', (args.smooth[0], int(args.smooth[1])))] if args.smooth else [])
+
+    start = time.time()
+    if args.files:
+        os.makedirs(args.out, exist_ok=True)
+        written = render_many([(_render_csv, (path, args.out, args.format, steps)) for path in args.files], args.workers)
+    else:
+        written = render_archive(args.out, args.archive, args.ids, args.format, args.workers, steps=steps)
+    print(f'{len(written)} reports written to {args.out} in {time.time() - start:.1f}s')
+    sys.exit(0)
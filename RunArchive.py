@@ -0,0 +1,77 @@
+import os, json, time, uuid, threading
+import RunCodec
+
+ARCHIVE_DIR = os.path.join(os.path.expanduser('~'), '.lucidsens', 'archive')
+
+
+def analysable(entry, run_ids=None):
+    """
+    Index entry predicate of the batch analyses: the runs of `run_ids` when given, otherwise every acquired run except
+    blanks, the raw reads kept next to a run (raw_of) and the segments pushed out of the live view
+    """
+    if run_ids:
+        return entry['id'] in run_ids
+    return not (entry.get('blank_run') or entry.get('raw_of') or entry.get('settings', {}).get('live'))
+
+
+class RunArchive:
+    """
+    Archive of acquired runs: every run is stored compressed as an .lsz file (see RunCodec) and listed in index.json
+    together with its acquisition settings and any value derived from it later on.
+    """
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.root, 'index.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        path = os.path.join(self.root, 'index.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def add(self, run, settings=None, **fields):
+        """Archives a RunIO.Run with its acquisition settings, returns the run id"""
+        run_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        RunCodec.save(os.path.join(self.root, run_id + RunCodec.EXTENSION), run)
+        entry = {'id': run_id, 'name': run.name, 'created': time.time(), 'rows': len(run.time),
+                 'samples': run.samples, 'settings': settings or {}}
+        entry.update(fields)
+        with self._lock:
+            index = self._read_index()
+            index[run_id] = entry
+            self._write_index(index)
+        return run_id
+
+    def update(self, run_id, **fields):
+        """Stores derived values (features, scores...) in the index entry of a run"""
+        with self._lock:
+            index = self._read_index()
+            index[run_id].update(fields)
+            self._write_index(index)
+
+    def update_many(self, fields):
+        """Same as update() for many runs at once ({run_id: fields}), the index is written once"""
+        with self._lock:
+            index = self._read_index()
+            for run_id, values in fields.items():
+                index[run_id].update(values)
+            self._write_index(index)
+
+    def load(self, run_id):
+        """Decodes an archived run"""
+        run = RunCodec.load(os.path.join(self.root, run_id + RunCodec.EXTENSION))
+        run.meta.setdefault('id', run_id)
+        return run
+
+    def entries(self, predicate=None):
+        """Index entries, oldest first, optionally filtered by `predicate(entry)`"""
+        entries = sorted(self._read_index().values(), key=lambda entry: entry['created'])
+        return [entry for entry in entries if predicate is None or predicate(entry)]
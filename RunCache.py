@@ -0,0 +1,140 @@
+import os, json, time, shutil, hashlib, threading
+import numpy as np
+import RunIO
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.lucidsens', 'cache')
+
+
+class SidecarWriter:
+    """Streams the rows of a run into a cache entry, the entry only becomes valid once finish() writes its metadata"""
+    def __init__(self, cache, path, entry):
+        self.cache = cache
+        self.path = os.path.realpath(path)
+        self.entry = entry
+        shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(entry)
+        self.rows, self.cols = 0, 0
+        self._f = open(os.path.join(entry, 'rows.f8'), 'wb')
+
+    def append(self, block):
+        """Appends a (rows x [time, samples...]) block"""
+        block = np.ascontiguousarray(block, dtype=np.float64)
+        self.rows += len(block)
+        self.cols = block.shape[1]
+        block.tofile(self._f)
+
+    def finish(self, headers, overview_t, overview_y, meta=None):
+        """Writes the overview and the metadata, the source size and mtime make the entry's key"""
+        self._f.close()
+        np.save(os.path.join(self.entry, 'overview.npy'), np.column_stack((overview_t, overview_y)))
+        stat = os.stat(self.path)
+        info = {'path': self.path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'rows': self.rows, 'cols': self.cols,
+                'headers': list(headers), 'meta': meta or {}}
+        with open(os.path.join(self.entry, 'meta.json'), 'w') as f:
+            json.dump(info, f)
+        self.cache._stored(self.entry)
+
+    def abort(self):
+        """Drops an unfinished entry"""
+        self._f.close()
+        shutil.rmtree(self.entry, ignore_errors=True)
+
+
+class SidecarCache:
+    """
+    Cache of pre-parsed runs: one binary sidecar (raw float64 rows + decimated overview + min/max pyramid + metadata)
+    per source file, keyed by path and validated against the source size and mtime. Entries are memory-mapped on load
+    and the least recently used ones are evicted once the cache grows beyond `budget_mb`.
+    """
+    def __init__(self, root=CACHE_DIR, budget_mb=512):
+        self.root = root
+        self.budget = budget_mb * 1024 ** 2
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry(self, path):
+        return os.path.join(self.root, hashlib.sha1(os.path.realpath(path).encode()).hexdigest())
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.root, 'index.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        with open(os.path.join(self.root, 'index.json'), 'w') as f:
+            json.dump(index, f)
+
+    def _touch(self, entry):
+        with self._lock:
+            index = self._read_index()
+            if os.path.basename(entry) in index:
+                index[os.path.basename(entry)][1] = time.time()
+                self._write_index(index)
+
+    def _stored(self, entry):
+        """Registers a finished entry and evicts the least recently used ones beyond the budget"""
+        size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+        with self._lock:
+            index = self._read_index()
+            index[os.path.basename(entry)] = [size, time.time()]
+            total = sum(item[0] for item in index.values())
+            for key, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+                if total <= self.budget or key == os.path.basename(entry):
+                    continue
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                del index[key]
+                total -= size
+            self._write_index(index)
+
+    def set_budget(self, budget_mb):
+        self.budget = budget_mb * 1024 ** 2
+
+    def load(self, path):
+        """Returns a RunIO.RunView over the memory-mapped sidecar of `path`, None when missing or stale"""
+        entry = self._entry(path)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                info = json.load(f)
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if info['size'] != stat.st_size or info['mtime'] != stat.st_mtime:
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        rows = np.memmap(os.path.join(entry, 'rows.f8'), dtype=np.float64, mode='r', shape=(info['rows'], info['cols']))
+        overview = np.load(os.path.join(entry, 'overview.npy'))
+        run = RunIO.Run(rows[:, 0], rows[:, 1:], info['headers'][1:], info['path'], info['meta'])
+        try:
+            pyramid = RunIO.MinMaxPyramid.load(run.time, run.data, os.path.join(entry, 'pyramid.npz'))
+        except (OSError, ValueError, KeyError):
+            pyramid = None
+        source = RunIO.RunView(run, overview[:, 0], overview[:, 1:], pyramid=pyramid)
+        if pyramid is None:
+            self._store_pyramid(entry, source.pyramid)
+        else:
+            self._touch(entry)
+        return source
+
+    def _store_pyramid(self, entry, pyramid):
+        """Adds the min/max pyramid built on the first load to the entry, later loads read it instead of the rows"""
+        path = os.path.join(entry, 'pyramid.npz')
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                pyramid.save(f)
+            os.replace(path + '.tmp', path)
+            self._stored(entry)
+        except OSError as e:
+            print(e)
+
+    def writer(self, path):
+        """Opens a streaming SidecarWriter for `path`"""
+        return SidecarWriter(self, path, self._entry(path))
+
+    def store(self, run, bins=2000):
+        """Adds a fully parsed RunIO.Run to the cache"""
+        sidecar = self.writer(run.path)
+        sidecar.append(np.column_stack((run.time, run.data)))
+        overview_t, overview_y = RunIO.minmax_decimate(run.time, run.data, bins)
+        sidecar.finish([RunIO.TIME_HEADER] + run.samples, overview_t, overview_y, run.meta)
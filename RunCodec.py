@@ -0,0 +1,110 @@
+import json, struct, zlib
+import numpy as np
+import RunIO
+
+MAGIC = b'LSZ1'
+EXTENSION = '.lsz'
+
+
+def _shuffle(words):
+    """Byte-shuffle: groups the n-th byte of every 64-bit word together so the constant high bytes deflate to nothing"""
+    return np.ascontiguousarray(words.view(np.uint8).reshape(-1, 8).T).tobytes()
+
+
+def _unshuffle(buf, n):
+    return np.ascontiguousarray(np.frombuffer(buf, dtype=np.uint8).reshape(8, n).T).view(np.uint64).ravel()
+
+
+def _zigzag(v):
+    return ((v << 1) ^ (v >> 63)).view(np.uint64)
+
+
+def _unzigzag(u):
+    return (u >> np.uint64(1)).view(np.int64) ^ -(u & np.uint64(1)).astype(np.int64)
+
+
+def _quantum(x):
+    """Estimates the ADC step of a column: least-squares fit of the differences to integer multiples of the smallest one"""
+    d = np.diff(x)
+    d = d[np.abs(d) > 0]
+    if not len(d):
+        return 0.0
+    m = np.rint(d / np.abs(d).min())
+    return float(np.dot(d, m) / np.dot(m, m))
+
+
+def encode_column(x, level=6):
+    """
+    Lossless column encoder, returns (params, blobs):
+    'fixed' - integer steps of the estimated ADC quantum, delta + zigzag coded, plus the XOR residual against the
+              reconstruction (all zeros when the data sits exactly on the quantum grid);
+    'xor'   - Gorilla-style XOR of every value with its predecessor.
+    Both are byte-shuffled and deflated, the smaller one wins.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    bits = x.view(np.uint64)
+    xored = bits.copy()
+    xored[1:] ^= bits[:-1]
+    best = ({'mode': 'xor'}, [zlib.compress(_shuffle(xored), level)])
+    q = _quantum(x) if len(x) else 0.0
+    if q:
+        steps = (x - x[0]) / q
+        if np.all(np.abs(steps) < 2 ** 52):
+            k = np.rint(steps).astype(np.int64)
+            recon = x[0] + k * q
+            dk = np.diff(k, prepend=np.int64(0))
+            blobs = [zlib.compress(_shuffle(_zigzag(dk)), level), zlib.compress(_shuffle(bits ^ recon.view(np.uint64)), level)]
+            if sum(map(len, blobs)) < len(best[1][0]):
+                best = ({'mode': 'fixed', 'x0': float(x[0]), 'q': q}, blobs)
+    return best
+
+
+def decode_column(params, blobs, n):
+    if params['mode'] == 'xor':
+        return np.bitwise_xor.accumulate(_unshuffle(zlib.decompress(blobs[0]), n)).view(np.float64)
+    k = np.cumsum(_unzigzag(_unshuffle(zlib.decompress(blobs[0]), n)))
+    recon = params['x0'] + k * params['q']
+    return (recon.view(np.uint64) ^ _unshuffle(zlib.decompress(blobs[1]), n)).view(np.float64)
+
+
+def encode_run(run, level=6):
+    """Encodes a RunIO.Run (time axis + every sample column) into the LSZ1 container"""
+    columns = [run.time] + [run.data[:, i] for i in range(run.data.shape[1])]
+    header = {'rows': len(run.time), 'samples': run.samples, 'meta': run.meta, 'columns': []}
+    payload = []
+    for column in columns:
+        params, blobs = encode_column(column, level)
+        params['sizes'] = [len(blob) for blob in blobs]
+        header['columns'].append(params)
+        payload.extend(blobs)
+    header = json.dumps(header).encode()
+    return b''.join([MAGIC, struct.pack('<I', len(header)), header] + payload)
+
+
+def decode_run(buf, path=''):
+    """Decodes an LSZ1 container back into a RunIO.Run, bit-identical to the encoded one"""
+    if buf[:4] != MAGIC:
+        raise ValueError('Not a LucidSens archive file.')
+    size = struct.unpack('<I', buf[4:8])[0]
+    header = json.loads(buf[8:8 + size])
+    pos, n, columns = 8 + size, header['rows'], []
+    for params in header['columns']:
+        blobs = []
+        for length in params['sizes']:
+            blobs.append(buf[pos:pos + length])
+            pos += length
+        columns.append(decode_column(params, blobs, n))
+    data = np.column_stack(columns[1:]) if n else np.empty((0, len(columns) - 1))
+    return RunIO.Run(columns[0], data, header['samples'], path, header['meta'])
+
+
+def save(path, run, level=6):
+    """Writes a run as an .lsz file"""
+    with open(path, 'wb') as f:
+        f.write(encode_run(run, level))
+
+
+def load(path):
+    """Reads an .lsz file"""
+    with open(path, 'rb') as f:
+        return decode_run(f.read(), path)
@@ -0,0 +1,290 @@
+import io, os, bisect, uuid
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+TIME_HEADER = 'Time (s)'
+
+
+def minmax_decimate(t, y, bins):
+    """Min/Max decimation: reduces (time x samples) data to 2 points per bin so no peak is lost"""
+    n = len(t)
+    if bins < 1 or n <= 2 * bins:
+        return t, y
+    per = n // bins
+    m = per * bins
+    yb = y[:m].reshape(bins, per, y.shape[1])
+    tb = t[:m].reshape(bins, per)
+    out_t = np.column_stack((tb[:, 0], tb[:, -1])).ravel()
+    out_y = np.stack((yb.min(axis=1), yb.max(axis=1)), axis=1).reshape(2 * bins, y.shape[1])
+    if m < n:
+        out_t = np.concatenate((out_t, [t[m], t[-1]]))
+        out_y = np.vstack((out_y, y[m:].min(axis=0), y[m:].max(axis=0)))
+    return out_t, out_y
+
+
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max pyramid of a (time x samples) matrix: level 0 holds the min and max of every `base`
+    rows, each next level merges `factor` bins of the previous one. view() picks the finest level with at most one
+    bin per pixel and slices it, so redrawing costs O(width) whatever the series length and no peak is ever lost.
+    Level 0 has at most `max_bins` bins (`base` grows with long runs), so the pyramid takes at most about
+    2 x 4/3 x max_bins x samples x 8 bytes (~1.4 MB per sample) however many rows the, possibly memory-mapped, data
+    has; ranges finer than level 0 are decimated from the rows themselves, at most `base` x width of them.
+    """
+    def __init__(self, t, y, base=8, factor=4, max_bins=2 ** 16):
+        self.t, self.y = t, y
+        base = max(base, -(-len(t) // max_bins))
+        self.base, self.factor = base, factor
+        self.sizes, self.mins, self.maxs = [], [], []
+        lo, hi, size = y, y, 1
+        step = base
+        while len(lo) > 2:
+            idx = np.arange(0, len(lo), step)
+            lo, hi = np.minimum.reduceat(lo, idx, axis=0), np.maximum.reduceat(hi, idx, axis=0)
+            size *= step
+            step = factor
+            self.sizes.append(size)
+            self.mins.append(lo)
+            self.maxs.append(hi)
+
+    def save(self, f):
+        """Writes the levels to an .npz file (path or file object), see load()"""
+        levels = {f'{kind}{level}': arrays[level] for level in range(len(self.sizes))
+                  for kind, arrays in (('min', self.mins), ('max', self.maxs))}
+        np.savez(f, base=self.base, factor=self.factor, sizes=np.array(self.sizes, dtype=np.int64), **levels)
+
+    @classmethod
+    def load(cls, t, y, f):
+        """Pyramid over (t, y) from the levels written by save(), the rows themselves are not read"""
+        pyramid = cls.__new__(cls)
+        pyramid.t, pyramid.y = t, y
+        with np.load(f) as stored:
+            pyramid.base, pyramid.factor = int(stored['base']), int(stored['factor'])
+            pyramid.sizes = stored['sizes'].tolist()
+            pyramid.mins = [stored[f'min{level}'] for level in range(len(pyramid.sizes))]
+            pyramid.maxs = [stored[f'max{level}'] for level in range(len(pyramid.sizes))]
+        if any(lo.shape[1:] != y.shape[1:] for lo in pyramid.mins):
+            raise ValueError('The pyramid does not match the data.')
+        return pyramid
+
+    def update(self, y, col):
+        """Rebins one column after its values changed, `y` being the current (possibly copied) data matrix"""
+        self.y = y
+        lo = hi = y[:, col]
+        step = self.base
+        for level in range(len(self.sizes)):
+            idx = np.arange(0, len(lo), step)
+            lo, hi = np.minimum.reduceat(lo, idx), np.maximum.reduceat(hi, idx)
+            self.mins[level][:, col] = lo
+            self.maxs[level][:, col] = hi
+            step = self.factor
+
+    def view(self, t0, t1, width=1000):
+        """Returns the points to draw for the range [t0, t1] on a `width` pixels wide plot"""
+        n = len(self.t)
+        i0 = max(int(np.searchsorted(self.t, t0, side='left')) - 1, 0)
+        i1 = min(int(np.searchsorted(self.t, t1, side='right')) + 1, n)
+        if i1 - i0 <= 2 * width or not self.sizes:
+            return self.t[i0:i1], self.y[i0:i1]
+        if i1 - i0 < self.sizes[0] * width / 2:
+            return minmax_decimate(self.t[i0:i1], self.y[i0:i1], width)
+        level = next((l for l, size in enumerate(self.sizes) if size * width >= i1 - i0), len(self.sizes) - 1)
+        size = self.sizes[level]
+        b0, b1 = i0 // size, (i1 - 1) // size + 1
+        starts = np.arange(b0, b1) * size
+        out_t = np.column_stack((self.t[starts], self.t[np.minimum(starts + size, n) - 1])).ravel()
+        out_y = np.stack((self.mins[level][b0:b1], self.maxs[level][b0:b1]), axis=1).reshape(2 * (b1 - b0), -1)
+        return out_t, out_y
+
+
+class Run:
+    """
+    In-memory run: time axis, (time x samples) data matrix, sample names and metadata. `token` identifies the run
+    object and `edits` counts the in-place changes of its data, together they key the processing results.
+    """
+    def __init__(self, time, data, samples, path='', meta=None):
+        self.time = np.asarray(time, dtype=np.float64)
+        self.samples = list(samples)
+        self.data = np.asarray(data, dtype=np.float64).reshape(len(self.time), len(self.samples))
+        self.path = path
+        self.meta = meta or {}
+        self.token = uuid.uuid4().hex
+        self.edits = 0
+
+    @property
+    def name(self):
+        return os.path.basename(self.path) if self.path else 'Untitled'
+
+    def aligned_time(self):
+        """Time axis relative to the first data point, used to overlay runs started at different times"""
+        return self.time - self.time[0] if len(self.time) else self.time
+
+
+def read_run(path):
+    """Parses a whole run file into a Run"""
+    df = pd.read_csv(path, dtype=np.float64)
+    if len(df.columns) < 2 or df.columns[0] != TIME_HEADER:
+        raise ValueError('Seems like your data is incomplete!')
+    values = df.to_numpy()
+    return Run(values[:, 0], values[:, 1:], df.columns[1:], os.path.realpath(path))
+
+
+def write_run(path, run):
+    """Writes a Run as a LucidSens CSV file"""
+    df = pd.DataFrame(np.column_stack((run.time, run.data)), columns=[TIME_HEADER] + run.samples)
+    df.to_csv(path, index=False)
+
+
+def from_response(resp, meta=None):
+    """Run of a sampling response of the LucidSens: notes are (samples, sampling time, interval), one read list per sample"""
+    samples, st, si = resp['notes'][0], resp['notes'][1], resp['notes'][2]
+    time_axis = np.round(np.arange(int(st / si)) * si, 2)
+    data = np.column_stack([np.asarray(resp['body'][i][1], dtype=np.float64) for i in range(samples)])[:len(time_axis)]
+    return Run(time_axis[:len(data)], data, [f'Sample #{i+1}' for i in range(samples)], meta=meta)
+
+
+def read_runs(paths, workers=None, progress_callback=None, cache=None):
+    """
+    Parses several run files in parallel on a process pool, keeps the given order and skips unreadable files.
+    Runs found in the sidecar `cache` (RunCache.SidecarCache) are not parsed again, parsed ones are added to it.
+    """
+    runs = [None] * len(paths)
+    misses = []
+    for idx, path in enumerate(paths):
+        cached = cache.load(path) if cache else None
+        if cached is None:
+            misses.append(idx)
+        else:
+            runs[idx] = cached.run
+    done = len(paths) - len(misses)
+    if misses:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = {pool.submit(read_run, paths[idx]): idx for idx in misses}
+            for future in as_completed(futures):
+                done += 1
+                try:
+                    runs[futures[future]] = future.result()
+                    if cache:
+                        cache.store(runs[futures[future]])
+                except Exception as e:
+                    print(f'{paths[futures[future]]}: {e}')
+                if progress_callback:
+                    progress_callback(round(done / len(paths) * 100))
+    return [run for run in runs if run is not None]
+
+
+class RunView:
+    """
+    Plot source over an in-memory (or memory-mapped) Run, same interface as ChunkedCSVReader. A `pyramid` already
+    built over the run (e.g. stored in its sidecar, see RunCache) saves reading all its rows.
+    """
+    def __init__(self, run, overview_t=None, overview_y=None, bins=2000, pyramid=None):
+        self.run = run
+        self.path = run.path
+        self.samples = run.samples
+        self.pyramid = pyramid or MinMaxPyramid(run.time, run.data)
+        if overview_t is None:
+            overview_t, overview_y = self.pyramid.view(-np.inf, np.inf, bins)
+        self.overview_t = np.asarray(overview_t)
+        self.overview_y = np.asarray(overview_y)
+
+    def view(self, t0, t1, width=1000):
+        """Returns the data to draw for the visible range [t0, t1] on a `width` pixels wide plot"""
+        return self.pyramid.view(t0, t1, width)
+
+    def update(self, col, bins=2000):
+        """Follows an edit of sample column `col` of the run: that column is rebinned, the overview is redrawn"""
+        self.pyramid.update(self.run.data, col)
+        self.overview_t, self.overview_y = self.pyramid.view(-np.inf, np.inf, bins)
+
+
+class ChunkedCSVReader:
+    """
+    Streaming reader for LucidSens CSV files:
+    scan() walks the file once in chunks of `chunk_rows` lines, keeping only the byte offset and the first
+    time-stamp of every chunk plus a min/max decimated overview, hence memory does not grow with the file size.
+    view() returns the overview or, once zoomed in far enough, the full-resolution rows of the visible range.
+    """
+    def __init__(self, path, chunk_rows=20000, bins_per_chunk=50, full_res_rows=200000):
+        self.path = os.path.realpath(path)
+        self.chunk_rows = chunk_rows
+        self.bins_per_chunk = bins_per_chunk
+        self.full_res_rows = full_res_rows
+        self.headers = []
+        self.rows = 0
+        self.offsets = []
+        self.starts = []
+        self.overview_t = np.empty(0)
+        self.overview_y = np.empty((0, 0))
+        self._block = (None, None, None)
+
+    def _parse(self, buf):
+        """Parses a block of CSV lines into a float array"""
+        return pd.read_csv(io.BytesIO(buf), header=None, dtype=np.float64).to_numpy()
+
+    def scan(self, progress_callback=None, sidecar=None):
+        """Single pass over the file: builds the chunk index and the decimated overview, parsed rows are streamed to `sidecar`"""
+        size = os.path.getsize(self.path) or 1
+        ov_t, ov_y = [], []
+        with open(self.path, 'rb') as f:
+            self.headers = f.readline().decode().strip().split(',')
+            if len(self.headers) < 2 or self.headers[0] != TIME_HEADER:
+                raise ValueError('Seems like your data is incomplete!')
+            while True:
+                offset = f.tell()
+                lines = [f.readline() for _ in range(self.chunk_rows)]
+                buf = b''.join(lines)
+                if not buf.strip():
+                    break
+                block = self._parse(buf)
+                if sidecar:
+                    sidecar.append(block)
+                self.offsets.append(offset)
+                self.starts.append(block[0, 0])
+                self.rows += len(block)
+                t, y = minmax_decimate(block[:, 0], block[:, 1:], self.bins_per_chunk)
+                ov_t.append(t)
+                ov_y.append(y)
+                if progress_callback:
+                    progress_callback(round(f.tell() / size * 100))
+            self.offsets.append(f.tell())
+        if not ov_t:
+            raise ValueError('Seems like your data is incomplete!')
+        self.overview_t = np.concatenate(ov_t)
+        self.overview_y = np.vstack(ov_y)
+        if sidecar:
+            sidecar.finish(self.headers, self.overview_t, self.overview_y)
+        return self
+
+    @property
+    def samples(self):
+        return self.headers[1:]
+
+    def _chunk_span(self, t0, t1):
+        i0 = max(bisect.bisect_right(self.starts, t0) - 1, 0)
+        i1 = max(bisect.bisect_right(self.starts, t1), i0 + 1)
+        return i0, min(i1, len(self.starts))
+
+    def fetch(self, t0, t1):
+        """Reads the full-resolution rows within [t0, t1] straight from the file"""
+        i0, i1 = self._chunk_span(t0, t1)
+        if self._block[:2] != (i0, i1):
+            with open(self.path, 'rb') as f:
+                f.seek(self.offsets[i0])
+                block = self._parse(f.read(self.offsets[i1] - self.offsets[i0]))
+            self._block = (i0, i1, block)
+        block = self._block[2]
+        mask = (block[:, 0] >= t0) & (block[:, 0] <= t1)
+        return block[mask, 0], block[mask, 1:]
+
+    def view(self, t0, t1, width=1000):
+        """Returns the data to draw for the visible range [t0, t1] on a `width` pixels wide plot"""
+        i0, i1 = self._chunk_span(t0, t1)
+        if (i1 - i0) * self.chunk_rows > self.full_res_rows:
+            mask = (self.overview_t >= t0) & (self.overview_t <= t1)
+            return self.overview_t[mask], self.overview_y[mask]
+        t, y = self.fetch(t0, t1)
+        return minmax_decimate(t, y, width)
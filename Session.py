@@ -0,0 +1,35 @@
+import os, json
+import numpy as np
+import RunIO
+
+SESSION_FILE = os.path.join(os.path.expanduser('~'), '.lucidsens', 'session.npz')
+
+
+def save_session(runs, view_range, state, path=SESSION_FILE):
+    """Writes the plotted runs, the visible range and the UI state into a single .npz snapshot"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {'range': np.asarray(view_range, dtype=np.float64)}
+    info = []
+    for i, run in enumerate(runs):
+        arrays[f't{i}'] = run.time
+        arrays[f'y{i}'] = run.data
+        info.append({'path': run.path, 'samples': run.samples})
+    arrays['info'] = np.array(json.dumps({'runs': info, 'state': state}))
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(path + '.tmp', path)
+
+
+def load_session(path=SESSION_FILE):
+    """Returns (runs, view_range, state) from the snapshot, None if there is no usable snapshot"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as snapshot:
+            info = json.loads(str(snapshot['info']))
+            runs = [RunIO.Run(snapshot[f't{i}'], snapshot[f'y{i}'], item['samples'], item['path'])
+                    for i, item in enumerate(info['runs'])]
+            return runs, snapshot['range'].reshape(2, 2), info['state']
+    except (OSError, ValueError, KeyError) as e:
+        print(e)
+        return None
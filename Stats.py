@@ -0,0 +1,13 @@
+import numpy as np
+
+
+def t_quantile(dof, level=0.95):
+    """
+    Two-sided Student t quantile of `level` for every degree of freedom in `dof` (at least 1). Needs scipy: the normal
+    quantile is far too small for the few degrees of freedom of replicates and fits, so there is no fallback.
+    """
+    try:
+        from scipy.stats import t
+    except ImportError as e:
+        raise ImportError('scipy is needed for the Student t quantiles of the confidence intervals and Grubbs tests.') from e
+    return t.ppf(0.5 + np.asarray(level, dtype=np.float64) / 2, np.maximum(dof, 1))
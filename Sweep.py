@@ -0,0 +1,91 @@
+import time, json, uuid, itertools, threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import RunIO, Analysis
+
+PARAMETERS = {'pv': float, 'ag': int, 'si': float, 'r2avg': int}
+METRICS = {'snr': 'SNR', 'sensitivity': 'Sensitivity (a.u.)'}
+
+
+def parse_grid(text):
+    """'pv=28,30,32; ag=1,64' -> {'pv': [28.0, 30.0, 32.0], 'ag': [1, 64]}, only the sweepable parameters are accepted"""
+    axes = {}
+    for part in filter(str.strip, text.split(';')):
+        name, _, values = part.partition('=')
+        name = name.strip()
+        if name not in PARAMETERS:
+            raise ValueError(f'{name} cannot be swept, use one of {", ".join(PARAMETERS)}.')
+        axes[name] = [PARAMETERS[name](value) for value in values.split(',') if value.strip()]
+    return axes
+
+
+def grid(body, axes):
+    """One sampling command body per combination of the axes, the other settings are taken from `body`"""
+    names = list(axes)
+    return [dict(body, **dict(zip(names, values))) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def score(run):
+    """Sweep metrics of a run: median SNR of its samples and median signal above the noise floor"""
+    quality = Analysis.quality(run)
+    with np.errstate(invalid='ignore'):
+        return {'snr': float(np.nanmedian(quality['SNR'])),
+                'sensitivity': float(np.nanmedian(run.data.max(axis=0) - quality['Noise floor (a.u.)']))}
+
+
+def run_sweep(senders, bodies, archive, progress_callback=None):
+    """
+    Runs every command body back to back, fanned out over the devices of `senders` ({device: send(command) -> response}):
+    each device takes the next pending point as soon as it is free, so faster devices take more of them. Every run is
+    archived with its settings, device and sweep id; returns {'id', 'results'} with one result per point.
+    """
+    sweep_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+    pending = iter(enumerate(bodies))
+    lock = threading.Lock()
+    results = [None] * len(bodies)
+
+    def work(device, send):
+        while True:
+            with lock:
+                n, body = next(pending, (None, None))
+            if body is None:
+                return
+            result = {'settings': body, 'device': device, 'id': None, 'snr': np.nan, 'sensitivity': np.nan}
+            try:
+                resp = send(json.dumps({'header': 'sampling', 'body': body}))
+                if 'sampling' in resp['header']:
+                    run = RunIO.from_response(resp, {'settings': body})
+                    run.path = f'sweep_{sweep_id}_{n}'
+                    result.update(score(run))
+                    result['id'] = archive.add(run, settings=body, device=device, sweep=sweep_id, features=Analysis.to_json(Analysis.features(run)),
+                                               quality=Analysis.to_json(Analysis.quality(run)))
+            except Exception as e:
+                print(e)
+            with lock:
+                results[n] = result
+                if progress_callback:
+                    progress_callback(round(sum(r is not None for r in results) / len(results) * 100))
+
+    with ThreadPoolExecutor(max_workers=max(len(senders), 1)) as pool:
+        for future in [pool.submit(work, device, send) for device, send in senders.items()]:
+            future.result()
+    return {'id': sweep_id, 'results': results}
+
+
+def heatmap(results, x='pv', y='ag', metric='snr'):
+    """
+    Metric of the sweep on an x/y grid, averaged over the other swept parameters (NaN where nothing was measured):
+    returns (x values, y values, matrix of shape (len(y), len(x)))
+    """
+    xv = np.array([r['settings'][x] for r in results], dtype=np.float64)
+    yv = np.array([r['settings'][y] for r in results], dtype=np.float64)
+    value = np.array([r[metric] for r in results], dtype=np.float64)
+    xs, xi = np.unique(xv, return_inverse=True)
+    ys, yi = np.unique(yv, return_inverse=True)
+    ok = np.isfinite(value)
+    total = np.zeros((len(ys), len(xs)))
+    count = np.zeros((len(ys), len(xs)))
+    np.add.at(total, (yi[ok], xi[ok]), value[ok])
+    np.add.at(count, (yi[ok], xi[ok]), 1)
+    with np.errstate(invalid='ignore'):
+        return xs, ys, total / count
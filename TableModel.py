@@ -0,0 +1,98 @@
+import operator
+import numpy as np
+import RunIO
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+
+
+class RunTableModel(QtCore.QAbstractTableModel):
+    """
+    Table model reading a RunIO.Run's arrays directly: cells are formatted on demand, sorting and filtering only
+    permute/select an index array of rows, so the table costs no Qt item per cell and no copy of the data.
+    Edited sample values are written back into the run and announced through EDITED(column).
+    """
+    EDITED = pyqtSignal(int)
+
+    def __init__(self, run, parent=None):
+        super(RunTableModel, self).__init__(parent)
+        self.run = run
+        self.headers = [RunIO.TIME_HEADER] + list(run.samples)
+        self.rows = np.arange(len(run.time))
+        self.sorting = None
+        self.dirty = False
+
+    def column(self, col):
+        return self.run.time if col == 0 else self.run.data[:, col - 1]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return f'{self.column(index.column())[self.rows[index.row()]]:.6g}'
+        if role == QtCore.Qt.EditRole:
+            return float(self.column(index.column())[self.rows[index.row()]])
+        if role == QtCore.Qt.TextAlignmentRole:
+            return int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.headers[section]
+        return str(self.rows[section] + 1)
+
+    def flags(self, index):
+        flags = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+        return flags | QtCore.Qt.ItemIsEditable if index.column() else flags
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        """Writes an edited sample value into the run (copied first if it is a read-only memory map)"""
+        if role != QtCore.Qt.EditRole or not index.column():
+            return False
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        if not self.run.data.flags.writeable:
+            self.run.data = np.array(self.run.data)
+        self.run.data[self.rows[index.row()], index.column() - 1] = value
+        self.run.edits += 1
+        self.dirty = True
+        self.dataChanged.emit(index, index, [role])
+        self.EDITED.emit(index.column())
+        return True
+
+    def _sorted(self, rows):
+        """`rows` in the order of the last sort() (col, order), unchanged before any"""
+        if self.sorting is None:
+            return rows
+        col, order = self.sorting
+        rows = rows[np.argsort(self.column(col)[rows], kind='stable')]
+        return rows[::-1] if order == QtCore.Qt.DescendingOrder else rows
+
+    def sort(self, col, order=QtCore.Qt.AscendingOrder):
+        """Sorts the visible rows by a column, the order is kept through later filters"""
+        self.layoutAboutToBeChanged.emit()
+        self.sorting = (col, order)
+        self.rows = self._sorted(self.rows)
+        self.layoutChanged.emit()
+
+    def set_filter(self, col, op, value):
+        """Keeps the rows where `column <op> value` holds, e.g. set_filter(1, '>', 2.5), in the current sort order"""
+        self.beginResetModel()
+        self.rows = self._sorted(np.nonzero(OPERATORS[op](self.column(col), value))[0])
+        self.endResetModel()
+
+    def clear_filter(self):
+        self.beginResetModel()
+        self.rows = self._sorted(np.arange(len(self.run.time)))
+        self.endResetModel()
@@ -1,8 +1,7 @@
-import sys, os, time, json, serial, socket
+import sys, os, re, time, json, serial, socket
 from PyQt5 import QtWidgets, QtTest, QtCore, QtGui
 from PyQt5.QtCore import pyqtSlot, pyqtSignal, QSettings
 import pyqtgraph as pg
-import matplotlib.pyplot as plt
 import numpy as np
 import serial.tools.list_ports as lp
 from array import array
@@ -12,6 +11,7 @@ import qdarkstyle, qdarkgraystyle
 import threading
 import traceback
 import mainWindowGUI, WifiWindow, PreferencesWindow
+import RunIO, RunCache, RunCodec, RunArchive, Session, PlotEngine, Reports, TableModel, Processing, Analysis, References, Fitting, Calibration, AutoRange, Sweep
 
 __APPNAME__ = "LucidSens"
 __VERSION__ = "0.04"
@@ -100,6 +100,9 @@ class WifiSettings(QtWidgets.QWidget, WifiWindow.Ui_WifiSettings):
 
 class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
     """Main window"""
+    # Rows (time, values) of the live monitor, emitted from its worker thread and drawn on the GUI thread
+    LIVE_ROWS = pyqtSignal(object)
+
     def __init__(self, parent=None):
         super(Form, self).__init__(parent)
 
@@ -108,12 +111,166 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
         # self.timer = QtCore.QTimer()
         self.threadpool = QtCore.QThreadPool()
 
+        # Sidecar cache of recently opened runs, budget in MB
+        self.cache = RunCache.SidecarCache(budget_mb=int(QSettings('Cache').value('Budget', 512)))
+        Processing.RESULTS.set_budget(int(QSettings('Cache').value('Results', 256)))
+
+        # Compressed archive of the acquired runs, may live on a shared drive
+        self.archive = RunArchive.RunArchive(QSettings('Archive').value('Path', RunArchive.ARCHIVE_DIR))
+        # Averaged blank/dark-count profiles per device and photodetection settings
+        self.references = References.ReferenceStore()
+        # Calibration curves (signal -> concentration) per device and photodetection settings
+        self.calibrations = Calibration.CalibrationStore()
+        self.last_command = {}
+
+        # Displayed run: plot source (streaming reader or in-memory view), refined on zoom/pan
+        self.run_source = None
+        self.display_source = None
+        self.live = None
+        self.monitoring = False
+        self.monitor_active = False
+        self.test_timer = QtCore.QTimer()
+        self.test_timer.timeout.connect(self.test_step)
+        self.view_timer = QtCore.QTimer()
+        self.view_timer.setSingleShot(True)
+        self.view_timer.timeout.connect(self.refine_view)
+
+        # Batch of runs opened together for comparison
+        self.batch_runs = []
+        self.batch_curves = []
+        self.batch_dock = None
+
+        # Replicate mean \u00b1 SD band over the displayed run, with its full-resolution source
+        self.envelope = None
+        self.envelope_source = None
+
+        # Data table: model over the current run's arrays
+        self.table_model = None
+        self.table_dock = None
+        self.features_dock = None
+        self.sweep_dock = None
+        # Last decay fits per (run id or path, model), used as warm starts
+        self.fit_cache = {}
+
         self.serial_connection = False
         self.wifi_connection = False
         # self.bt_connected = False
 
         self.setupUi(self)
         self.actionOpen.triggered.connect(self.open)
+        self.actionOpen_Multiple = QtWidgets.QAction('Open Multiple...', self)
+        self.actionOpen_Multiple.setStatusTip('Open several runs to compare them')
+        self.actionOpen_Multiple.triggered.connect(self.open_multiple)
+        self.menuFile.insertAction(self.actionSave, self.actionOpen_Multiple)
+        self.actionExport_Report = QtWidgets.QAction('Export Report...', self)
+        self.actionExport_Report.setStatusTip('Export the plot, parameters and summary of the current run as PNG/PDF')
+        self.actionExport_Report.triggered.connect(self.export_report)
+        self.menuFile.insertAction(self.actionPreferences, self.actionExport_Report)
+
+        # View menu: small-multiples grid for large sample counts, legend on demand
+        self.tile_threshold = 18
+        self.menuView = QtWidgets.QMenu('View', self.menubar)
+        self.actionTile_Samples = QtWidgets.QAction('Tile Samples', self, checkable=True)
+        self.actionTile_Samples.setStatusTip(f'One small plot per sample, automatic beyond {self.tile_threshold} samples')
+        self.actionTile_Samples.toggled.connect(self.redraw_run)
+        self.actionShow_Legend = QtWidgets.QAction('Show Legend', self, checkable=True)
+        self.actionShow_Legend.setStatusTip(f'Lists every curve, by default only the first {self.tile_threshold} are listed')
+        self.actionShow_Legend.toggled.connect(lambda show: self.curves.show_legend(show))
+        self.actionData_Table = QtWidgets.QAction('Data Table', self)
+        self.actionData_Table.setStatusTip('Show the values of the current run in an editable table')
+        self.actionData_Table.triggered.connect(self.import_table)
+        self.menuView.addAction(self.actionData_Table)
+        self.menuView.addAction(self.actionTile_Samples)
+        self.menuView.addAction(self.actionShow_Legend)
+        self.actionReplicate_Envelope = QtWidgets.QAction('Replicate Envelope', self, checkable=True)
+        self.actionReplicate_Envelope.setStatusTip('Plots the mean \u00b1 SD of the samples, treated as replicates, outliers left out')
+        self.actionReplicate_Envelope.setChecked(QSettings('Processing').value('Envelope', 'false') == 'true')
+        self.actionReplicate_Envelope.toggled.connect(lambda checked: QSettings('Processing').setValue('Envelope', 'true' if checked else 'false'))
+        self.actionReplicate_Envelope.toggled.connect(self.draw_envelope)
+        self.menuView.addAction(self.actionReplicate_Envelope)
+        self.actionLive_Monitor = QtWidgets.QAction('Live Monitor', self, checkable=True)
+        self.actionLive_Monitor.setStatusTip('Samples continuously in short segments with the panel settings, scrolling the last minute')
+        self.actionLive_Monitor.toggled.connect(self.live_monitor)
+        self.menuView.addAction(self.actionLive_Monitor)
+        self.LIVE_ROWS.connect(lambda rows: self.live_data(*rows))
+        self.menubar.insertMenu(self.menuHelp.menuAction(), self.menuView)
+
+        # Analysis menu: baseline correction stage, kinetics features of the current run and of the archive
+        self.menuAnalysis = QtWidgets.QMenu('Analysis', self.menubar)
+        self.actionFeatures = QtWidgets.QAction('Features', self)
+        self.actionFeatures.setStatusTip('Peak, time-to-peak, area and decay rate of every sample of the current run')
+        self.actionFeatures.triggered.connect(self.show_features)
+        self.actionArchive_Features = QtWidgets.QAction('Update Archive Features', self)
+        self.actionArchive_Features.setStatusTip('Computes the features and quality scores of every archived run and stores them in the archive index')
+        self.actionArchive_Features.triggered.connect(self.archive_features)
+        self.menuBaseline = self.menuAnalysis.addMenu('Baseline Correction')
+        self.baseline_group = QtWidgets.QActionGroup(self)
+        for method, title in [('none', 'None')] + list(Processing.BASELINES.items()):
+            action = self.baseline_group.addAction(QtWidgets.QAction(title, self, checkable=True))
+            action.setData(method)
+            action.setChecked(QSettings('Processing').value('Baseline', 'none') == method)
+            self.menuBaseline.addAction(action)
+        self.baseline_group.triggered.connect(self.baseline_changed)
+        self.actionAcquire_Blank = QtWidgets.QAction('Acquire Blank', self, checkable=True)
+        self.actionAcquire_Blank.setStatusTip('The next sampling run is a blank, it is averaged into the reference of its settings')
+        self.actionSubtract_Blank = QtWidgets.QAction('Subtract Blank', self, checkable=True)
+        self.actionSubtract_Blank.setStatusTip('Subtracts the blank reference of the same device and settings from every sampling run')
+        self.actionSubtract_Blank.setChecked(QSettings('Processing').value('SubtractBlank', 'false') == 'true')
+        self.actionSubtract_Blank.toggled.connect(lambda checked: QSettings('Processing').setValue('SubtractBlank', 'true' if checked else 'false'))
+        self.menuAnalysis.addAction(self.actionAcquire_Blank)
+        self.menuAnalysis.addAction(self.actionSubtract_Blank)
+        self.menuAnalysis.addSeparator()
+        self.actionRaw_Mode = QtWidgets.QAction('Raw ADC Mode', self, checkable=True)
+        self.actionRaw_Mode.setStatusTip('The device streams every ADC read, averaging is done (and can be redone) on the host')
+        self.actionRaw_Mode.setChecked(QSettings('Processing').value('RawMode', 'false') == 'true')
+        self.actionRaw_Mode.toggled.connect(lambda checked: QSettings('Processing').setValue('RawMode', 'true' if checked else 'false'))
+        self.menuRaw_Filter = QtWidgets.QMenu('Raw Filter', self)
+        self.raw_filter_group = QtWidgets.QActionGroup(self)
+        for method, title in Processing.RAW_FILTERS.items():
+            action = self.raw_filter_group.addAction(QtWidgets.QAction(title, self, checkable=True))
+            action.setData(method)
+            action.setChecked(QSettings('Processing').value('RawFilter', 'mean') == method)
+            self.menuRaw_Filter.addAction(action)
+        self.raw_filter_group.triggered.connect(lambda action: QSettings('Processing').setValue('RawFilter', action.data()))
+        self.actionRederive = QtWidgets.QAction('Re-derive from Raw Reads...', self)
+        self.actionRederive.setStatusTip('Recomputes the current run from its archived raw reads with another averaging setting')
+        self.actionRederive.triggered.connect(self.rederive)
+        self.actionAuto_Range = QtWidgets.QAction('Auto-Range', self, checkable=True)
+        self.actionAuto_Range.setStatusTip('A short pre-acquisition picks the SiPM voltage and ADC gain before every sampling run')
+        self.actionAuto_Range.setChecked(QSettings('Processing').value('AutoRange', 'false') == 'true')
+        self.actionAuto_Range.toggled.connect(lambda checked: QSettings('Processing').setValue('AutoRange', 'true' if checked else 'false'))
+        self.menuAnalysis.addAction(self.actionAuto_Range)
+        self.menuAnalysis.addAction(self.actionRaw_Mode)
+        self.actionSweep = QtWidgets.QAction('Parameter Sweep...', self)
+        self.actionSweep.setStatusTip('Samples at every combination of PMV voltage, ADC gain, interval and reads per point, on every connected device')
+        self.actionSweep.triggered.connect(self.parameter_sweep)
+        self.menuAnalysis.addMenu(self.menuRaw_Filter)
+        self.menuAnalysis.addAction(self.actionRederive)
+        self.menuAnalysis.addAction(self.actionSweep)
+        self.menuAnalysis.addSeparator()
+        self.menuAnalysis.addAction(self.actionFeatures)
+        self.menuAnalysis.addAction(self.actionArchive_Features)
+        self.actionDegraded_Runs = QtWidgets.QAction('Find Degraded Runs...', self)
+        self.actionDegraded_Runs.setStatusTip('Lists the archived runs with a sample below a minimum signal-to-noise ratio')
+        self.actionDegraded_Runs.triggered.connect(self.degraded_runs)
+        self.menuAnalysis.addAction(self.actionDegraded_Runs)
+        self.menuFit = self.menuAnalysis.addMenu('Fit Decay')
+        self.menuFit.addAction('Exponential', lambda: self.fit_decay('exp'))
+        self.menuFit.addAction('Bi-exponential', lambda: self.fit_decay('biexp'))
+        self.menuFit.addSeparator()
+        self.menuFit.addAction('Refit Archive...', self.archive_fits)
+        self.menuOutliers = self.menuAnalysis.addMenu('Replicate Outliers')
+        self.outlier_group = QtWidgets.QActionGroup(self)
+        for method, title in Analysis.OUTLIER_METHODS.items():
+            action = self.outlier_group.addAction(QtWidgets.QAction(title, self, checkable=True))
+            action.setData(method)
+            action.setChecked(QSettings('Processing').value('Outliers', 'mad') == method)
+            self.menuOutliers.addAction(action)
+        self.outlier_group.triggered.connect(self.outliers_changed)
+        self.menuCalibration = self.menuAnalysis.addMenu('Calibration')
+        self.menuCalibration.addAction('Mark Standards...', self.mark_standards)
+        self.menuCalibration.addAction('Build Calibration...', self.build_calibration)
+        self.menubar.insertMenu(self.menuHelp.menuAction(), self.menuAnalysis)
         self.actionNew.triggered.connect(self.new)
         self.actionSave_As.triggered.connect(self.save_as)
         self.actionSave.triggered.connect(self.save)
@@ -127,11 +284,7 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
         self.actionConnection.triggered.connect(self.connection_status)
         self.actionPreferences.triggered.connect(self.preferences)
         
-        self.graphicsView.clear()
-        self.p0 = self.graphicsView.addPlot()
-        self.p0.showAxis('right', show=True)
-        self.p0.showAxis('top', show=True)
-        self.p0.showGrid(x=True, y=True, alpha=1)
+        self.reset_plot()
         
         self.textBrowser.append(self.pen(3, 'cyan') +  "Lucid" + "</font>" + self.pen(3, 'orange') + "Sens" + "</font>" + self.pen(2, 'white') + " (Chemiluminescence-wing)" + "</font>")
         self.textBrowser.append(self.pen(2, 'green') + "-"*75)
@@ -173,6 +326,9 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
 
         # Data Smooting
         self.comboBox_SGorders.currentIndexChanged.connect(self.smth_chk)
+        self.checkBox_DataSmth.stateChanged.connect(self.processing_changed)
+        self.comboBox_Smt.currentIndexChanged.connect(self.processing_changed)
+        self.comboBox_SGorders.currentIndexChanged.connect(self.processing_changed)
 
     # def ip_chk(self):
     #     try:
@@ -544,6 +700,50 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
         self.order = self.comboBox_SGorders.currentText()
         return [self.algo, self.order] 
 
+    def processing_steps(self):
+        """Processing pipeline of the current settings: baseline correction, then smoothing (see Processing.process)"""
+        steps = []
+        method = QSettings('Processing').value('Baseline', 'none')
+        if method in Processing.BASELINES:
+            param = QSettings('Processing').value('BaselineDegree', 1) if method == 'poly' else QSettings('Processing').value('BaselineLambda', 1e6)
+            steps.append(('baseline', (method, float(param), None)))
+        if self.checkBox_DataSmth.isChecked():
+            algo, order = self.smth_chk()
+            steps.append(('smooth', (algo, int(order))))
+        return steps
+
+    def processed_run(self, run):
+        """Applies the processing pipeline (if any) to a RunIO.Run, every step vectorised over all samples"""
+        return Processing.process(run, self.processing_steps())
+
+    def processed(self, source):
+        """Plot source of the processed data (memoised, flipping back to a previous setting is instant), the raw source is kept for editing and saving"""
+        steps = self.processing_steps()
+        if not steps or not hasattr(source, 'run'):
+            return source
+        return Processing.process_view(source.run, steps)
+
+    def baseline_changed(self, action):
+        """Stores the baseline correction chosen in the Analysis menu and reprocesses the displayed data"""
+        QSettings('Processing').setValue('Baseline', action.data())
+        self.processing_changed()
+
+    def outliers_changed(self, action):
+        """Stores the outlier rejection chosen in the Analysis menu and updates the envelope and the Features dock"""
+        QSettings('Processing').setValue('Outliers', action.data())
+        self.draw_envelope()
+        if self.features_dock is not None and self.features_dock.isVisible() and self.features_dock.windowTitle() == 'Features':
+            self.show_features()
+
+    def processing_changed(self):
+        """Redraws the displayed data with the new processing settings"""
+        if self.run_source is not None:
+            self.display_source = self.processed(self.run_source)
+            self.draw_envelope()
+            self.refine_view()
+        elif self.batch_runs:
+            self.draw_batch()
+
     def error_report(self, tpl):
         """Error report: Thread exceptions will be reflecred on the textBrowser"""
         self.textBrowser.append(f'THREAD: ERROR:\n{tpl}')
@@ -562,10 +762,31 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
         elif 'incubation' in txt:
             txt = 'Incubation in progress. please be patient. \n\nNote: Incubation can be canceled by clicking on the Stop button.'
 
+        elif 'autorange' in txt:
+            txt = 'Pre-scan is done, sampling is initialised.'
+
+        elif 'monitor' in txt:
+            txt = 'Live monitoring stopped, the monitored data is archived.'
+
+        elif 'sweep' in txt:
+            txt = 'Parameter sweep is done, every run is archived.'
+
         elif 'sampling' in txt:
             # txt = 'Sampling is initialised, please be patient.'
             txt = 'Sampling is done...illustrating.'
 
+        elif 'features' in txt:
+            txt = 'Features and quality scores of the archived runs are updated.'
+
+        elif 'fits' in txt:
+            txt = 'Decay fits of the archived runs are updated.'
+
+        elif 'open failed' in txt:
+            txt = 'Failed to open the data file.'
+
+        elif 'open' in txt:
+            txt = 'Data file is loaded.'
+
         else:
             txt = 'Task was not clear, howerver, it is handled now!'
 
@@ -741,8 +962,8 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
             msg.setWindowTitle("Warning")
             msg.exec_()
 
-    def serial_sndr_recvr(self, command, progress_callback=1):
-        """This method encapsulates, encodes and decodes the commands and responses to and from the LucidSens"""
+    def serial_sndr_recvr(self, command, progress_callback=1, operator=None):
+        """This method encapsulates, encodes and decodes the commands and responses to and from the LucidSens (or `operator`)"""
         def chopper(cmd):
             data = []
             segments = [cmd[i:i + 256] for i in range(0, len(cmd), 256)]
@@ -753,17 +974,19 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
                     data.append(segment + '_#')
             return data
 
-        self.content = ''
+        operator = operator or self.operator
+        resp_file = 'resp.txt' if operator is self.operator else f'resp_{os.path.basename(operator.port)}.txt'
+        content = ''
         delay = 1000
         print('Waiting for invitation', end='')
         self.statusbar.showMessage('Waiting for invitation')
-        while b'sr_receiver: READY\n' not in self.operator.read_all():
+        while b'sr_receiver: READY\n' not in operator.read_all():
             QtTest.QTest.qWait(delay)
         print('\nInvited, sending GO!')
         self.statusbar.showMessage('Invited, sending GO!')
 
-        while b'got it.\n' not in self.operator.read_all():
-            self.operator.write('go#'.encode())
+        while b'got it.\n' not in operator.read_all():
+            operator.write('go#'.encode())
             QtTest.QTest.qWait(delay)
 
         # __SERIAL SENDER__ 
@@ -771,9 +994,9 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
             if len(command) > 256:
                 for idx, data in enumerate([chunk for chunk in chopper(command)]):
                     while True:
-                        self.operator.write(data.encode())
+                        operator.write(data.encode())
                         QtTest.QTest.qWait(delay)
-                        resp = self.operator.read_all()
+                        resp = operator.read_all()
                         if 'EOF received.\n' in resp.decode():
                             break
                         elif 'got it.\n' in resp.decode():
@@ -785,13 +1008,13 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
             else:
                 self.statusbar.showMessage('Sending...')
                 command += '*#'
-                self.operator.write(command.encode())
+                operator.write(command.encode())
                 QtTest.QTest.qWait(delay)
-                resp = self.operator.read_all()
+                resp = operator.read_all()
                 while 'EOF received.\n' not in resp.decode():
-                    self.operator.write(command.encode())
+                    operator.write(command.encode())
                     QtTest.QTest.qWait(delay)
-                    resp = self.operator.read_all()
+                    resp = operator.read_all()
                     if 'EOF received.\n' in resp.decode():
                         break
                     elif 'got it.\n' in resp.decode():
@@ -804,10 +1027,10 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
             self.statusbar.showMessage('Waiting...')
             print('Waiting...')
             counter = 0
-            while '*' not in self.content:
+            while '*' not in content:
                 try:
                     QtTest.QTest.qWait(100)
-                    data = self.operator.read_all()
+                    data = operator.read_all()
                     data_decd = data.decode()
                     a_idx = data_decd.find('<') - len(data_decd)
                     current_idx = data_decd[a_idx+1:data_decd.find('/')]
@@ -816,19 +1039,20 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
                     if '#' in data_decd :
                         self.statusbar.showMessage('Receiving...')
                         if '*' in data_decd:
-                            self.content += data_decd[:-1]
+                            content += data_decd[:-1]
                             print('Response received.')
                             self.statusbar.showMessage('[Received]: 100%')
                             QtTest.QTest.qWait(500)
                             break
                         elif '_' in data_decd and int(current_idx) > counter:
-                            self.content += data_decd[:a_idx]
-                            self.operator.write('got it.#'.encode())
+                            content += data_decd[:a_idx]
+                            operator.write('got it.#'.encode())
                             progress = round((int(current_idx) / int(z_idx)) * 100)
                             sys.stdout.write(f"[Received]: {progress}%\r")
                             sys.stdout.flush()
                             counter += 1
-                            progress_callback.emit(round((int(current_idx) / int(z_idx)) * 100))
+                            if hasattr(progress_callback, 'emit'):
+                                progress_callback.emit(round((int(current_idx) / int(z_idx)) * 100))
                             QtTest.QTest.qWait(100)
                         else:
                             pass
@@ -837,13 +1061,13 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
                 except:
                     pass
             counter = 0
-            # print(f'Response: {self.content}')
-            if '*' in self.content:
-                self.operator.write('EOF received.#'.encode())
-                with open('resp.txt', 'w') as raw_resp:
-                    raw_resp.write(self.content[:-1])
+            # print(f'Response: {content}')
+            if '*' in content:
+                operator.write('EOF received.#'.encode())
+                with open(resp_file, 'w') as raw_resp:
+                    raw_resp.write(content[:-1])
                 self.statusbar.showMessage('Response is being processed.\nDone.')
-                with open('resp.txt', 'r') as f:
+                with open(resp_file, 'r') as f:
                     for line in f:
                         return eval(line)
             else:
@@ -859,7 +1083,7 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
         """Handles the responses and task completion signs"""
         if 'test' in resp['header']:
             self.statusbar.showMessage('Just had a nice chat with the LS! serial connection is up and running.')
-            self.test()
+            self.test(resp['body'])
         
         elif 'kill' in resp['header']:
             self.statusbar.showMessage('Incubation was canceled.')
@@ -888,76 +1112,134 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
             msg.setIcon(QtWidgets.QMessageBox.Information)
             msg.exec_()
 
+        elif 'autorange' in resp['header']:
+            # The sampling run starts right after its pre-scan, with the chosen settings shown in the panel
+            command = resp['body']
+            if 'failed' in resp['header']:
+                self.textBrowser.append(self.pen(2, 'orange') + "Auto-ranging failed, sampling with the panel settings." + "</font>")
+            else:
+                notes = resp['notes']
+                self.lineEdit_PMV.setText(f"{command['body']['pv']:g}")
+                self.lineEdit_ADCGain.setText(str(command['body']['ag']))
+                self.textBrowser.append(self.pen() + f"Auto-range ({notes['scans']} pre-scan(s)): PMV {notes['pv']:g} V, ADC gain {notes['ag']}, "
+                                        f"expected peak at {notes['predicted']:.0%} of full scale." + "</font>")
+            self.send_command(command)
+
+        elif 'sweep' in resp['header']:
+            self.show_sweep(resp['body'])
+
+        elif 'monitor' in resp['header']:
+            # The last rows of the monitor are archived, the final window stays on the plot (unless a new monitor took it)
+            if not self.monitor_active:
+                self.stop_live_view()
+                self.actionLive_Monitor.blockSignals(True)
+                self.actionLive_Monitor.setChecked(False)
+                self.actionLive_Monitor.blockSignals(False)
+
         elif 'sampling' in resp['header']:
             self.statusbar.showMessage('Sampling in progress')
             time_axis = [round((i*resp['notes'][2]), 2) for i in range(int(resp['notes'][1]/resp['notes'][2]))]
-            data = []
             samples = resp['notes'][0]
-            colors = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'w', '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+            settings = self.last_command.get('body', {})
+            meta = {'settings': settings}
+            raw = None
+            if settings.get('raw'):
+                # Raw mode: every ADC read is streamed, the host reduces each interval's r2avg reads to one point
+                reads = np.column_stack([Processing.unpack_reads(resp['body'][i][1]) for i in range(samples)])
+                method = QSettings('Processing').value('RawFilter', 'mean')
+                data = Processing.decimate_reads(reads, settings['r2avg'], method)[:len(time_axis)]
+                raw_time = (np.asarray(time_axis)[:, None] + np.arange(settings['r2avg']) * resp['notes'][2] / settings['r2avg']).ravel()
+                raw = RunIO.Run(raw_time[:len(reads)], reads[:len(raw_time)], [f'Sample #{i+1}' for i in range(samples)], 'raw_data', {'settings': settings})
+                meta['raw_filter'] = {'method': method, 'r2avg': settings['r2avg']}
+            else:
+                data = np.column_stack([np.asarray(resp['body'][i][1], dtype=np.float64) for i in range(samples)])
+
+            # Blank runs feed the reference of their settings, the reference is subtracted from the other runs
+            device = self.operator.port if self.serial_connection else ''
+            if self.actionAcquire_Blank.isChecked():
+                count = self.references.add(RunIO.Run(time_axis, data, [f'Sample #{i+1}' for i in range(samples)]), device, settings)
+                self.actionAcquire_Blank.setChecked(False)
+                meta['blank_run'] = True
+                self.textBrowser.append(self.pen() + f"Blank recorded, {count} blank(s) averaged for these settings." + "</font>")
+            elif self.actionSubtract_Blank.isChecked():
+                offset = self.references.offset(device, settings, data.shape)
+                if offset is not None:
+                    data = data - offset
+                    meta['blank'] = References.reference_key(device, settings)
+                else:
+                    self.textBrowser.append(self.pen(2, 'orange') + "No blank recorded for these settings, raw counts are shown." + "</font>")
 
-            for i in range(samples):
-                data.append((resp['body'][i][1]).tolist())
-                # Plotting each sample
-                self.plot_data(time_axis, resp['body'][i][1].tolist(), color=colors[i], title=f'Sample #{i+1}')
             # Saving data as a CSV file
-            data[0:0] = [time_axis]
-            _, merged_list = [], []
-            for i in range(len(data[0])):
-                for j in range(samples + 1): 
-                    _.append(data[j][i])
-                merged_list.append(_)
-                _ = []
-
             with open('latest_data.csv', 'w', newline='') as f:
                 writer = csv.writer(f)
                 headers = [f'Sample #{i+1}' for i in range(samples)]
                 headers[0:0] = ['Time (s)']
                 writer.writerow(headers)
-                for row in merged_list:
-                    writer.writerow(row)
-                self.current_file = 'latest_data.csv'
-            with open('latest_data.csv', 'r') as f:
+                writer.writerows(np.column_stack((time_axis, data)).tolist())
                 self.current_file = os.path.realpath(f.name)
+
+            # Plotting the samples, full-resolution data stays in the run's min/max pyramid
+            run = RunIO.Run(time_axis, data, headers[1:], self.current_file, meta)
+            self.show_run({'header': 'sampling', 'body': RunIO.RunView(run)})
+            features = Analysis.features(run)
+            scores = Analysis.quality(run)
+            concentrations = self.calibrations.predict(device, settings, features)
+            table = dict(features, **scores)
+            if concentrations is not None:
+                table['Concentration'] = concentrations
+                outside = int(np.isnan(concentrations).sum())
+                if outside:
+                    self.textBrowser.append(self.pen(2, 'orange') + f"{outside} sample(s) outside the calibrated range, no concentration is reported for them." + "</font>")
+            self.fill_features(run.samples, table)
+            min_snr = float(QSettings('Processing').value('MinSNR', 10))
+            if not meta.get('blank_run') and np.nanmin(scores['SNR'], initial=np.inf) < min_snr:
+                self.textBrowser.append(self.pen(2, 'orange') + f"Noisy run: SNR {np.nanmin(scores['SNR']):.3g} is below {min_snr:g}, consider repeating it." + "</font>")
+            try:
+                run.meta['id'] = self.archive.add(run, settings=settings, device=device, features=Analysis.to_json(features), quality=Analysis.to_json(scores),
+                                                  blank_run=meta.get('blank_run', False), blank_subtracted='blank' in meta)
+                if concentrations is not None:
+                    self.archive.update(run.meta['id'], predicted=Analysis.to_json({'Concentration': concentrations})['Concentration'])
+                if raw is not None:
+                    self.archive.add(raw, settings=settings, raw_of=run.meta['id'])
+            except Exception as e:
+                print(e)
+                self.textBrowser.append(self.pen(2, 'red') + "Failed to archive the run!" + "</font>")
         else:
             print(f'response: {resp}', type(resp))
 
-    def test(self):
-        """Plots the serial test module"""
-        while not os.path.exists('resp.txt'):
-            pass
-        try:
-            with open('resp.txt', 'r') as f:
-                for line in f:
-                    if 'test' in eval(line)['header']:
-                        self.statusbar.showMessage('Astroid list is received, illustrating...')
-                        list_t = eval(line)['body']
-                    else:
-                        print('Something is wrong with the received list.')
-            self.graphicsView.clear()
-            self.p0 = self.graphicsView.addPlot()
-            self.p0.showAxis('right', show=True)
-            self.p0.showAxis('top', show=True)
-            self.p0.showGrid(x=True, y=True, alpha=1)
-            for _ in range(1):
-                for i in range(len(list_t)):
-                    self.p0.plot(title="Connection Test", x=list_t[i][0], y=list_t[i][1], pen=pg.mkPen((i, 2), width=2))
-                    QtTest.QTest.qWait(10)
-                    self.p0.plot(title="Connection Test", x=list_t[i][0], y=list_t[i][2], pen=pg.mkPen((i, 2), width=2))
-                    QtTest.QTest.qWait(10)
-                QtTest.QTest.qWait(3000)
-                for i in reversed(range(len(list_t))):
-                    QtTest.QTest.qWait(10)
-                    self.p0.plot(title="Connection Test", x=list_t[i][0], y=list_t[i][1], pen=pg.mkPen('k', width=2))
-                    QtTest.QTest.qWait(10)
-                    self.p0.plot(title="Connection Test", x=list_t[i][0], y=list_t[i][2], pen=pg.mkPen('k', width=2))
-                    QtTest.QTest.qWait(10)
-            self.graphicsView.clear()
-            self.p0 = self.graphicsView.addPlot()
-            self.p0.showAxis('right', show=True)
-            self.p0.showAxis('top', show=True)
-            self.p0.showGrid(x=True, y=True, alpha=1)
-        except Exception as e:
-            print(e)
+    def test(self, list_t, fps=30, hold=3):
+        """
+        Plots the serial test module: the received lists are drawn one by one, held for `hold` seconds and erased in
+        reverse order. Two reusable curves (one per pen) are driven by a QTimer at `fps` frames per second.
+        """
+        self.statusbar.showMessage('Astroid list is received, illustrating...')
+        self.reset_plot()
+        self.test_curves = []
+        for parity in range(2):
+            xs, ys, ends = [], [], [0]
+            for x, y1, y2 in list_t[parity::2]:
+                xs += [x, [np.nan], x, [np.nan]]
+                ys += [y1, [np.nan], y2, [np.nan]]
+                ends.append(ends[-1] + 2 * len(x) + 2)
+            curve = self.p0.plot(pen=pg.mkPen((parity, 2), width=2), connect='finite')
+            data = (np.concatenate(xs), np.concatenate(ys)) if xs else (np.empty(0), np.empty(0))
+            self.test_curves.append((curve, data, ends))
+        n = len(list_t)
+        self.test_frames = list(range(1, n + 1)) + [n] * int(hold * fps) + list(range(n - 1, -1, -1))
+        self.test_frame = 0
+        self.test_timer.start(int(1000 / fps))
+
+    def test_step(self):
+        """Draws the next frame of the serial test animation"""
+        if self.test_frame >= len(self.test_frames):
+            self.reset_plot()
+            return
+        shown = self.test_frames[self.test_frame]
+        if not self.test_frame or shown != self.test_frames[self.test_frame - 1]:
+            for parity, (curve, (x, y), ends) in enumerate(self.test_curves):
+                k = ends[(shown + 1 - parity) // 2]
+                curve.setData(x=x[:k], y=y[:k], connect='finite')
+        self.test_frame += 1
 
     def run_test(self):
         """Prepares the serial test command"""
@@ -975,8 +1257,6 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
             test_worker.signals.ERROR.connect(self.error_report)
             test_worker.signals.PROGRESS.connect(self.progress_status)
             self.threadpool.start(test_worker)
-            # self.timer.singleShot(15000, lambda: self.test())
-            QtTest.QTest.qWait(20000)
 
         else:
             self.textBrowser.append(self.pen() + "No available connections to the LucidSens,\nPlease re-establish the connection first." + "</font>")
@@ -991,9 +1271,13 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
         
     def run(self):
         """Prepares the run command"""
+        if self.monitoring:
+            self.statusbar.showMessage('Stop the live monitor first.')
+            return
         if os.path.exists("resp.txt"):
             os.remove("resp.txt")
-        self.p0.clear()
+        self.curves.clear()
+        self.run_source = None
         if self.checkBox_IncubMod.isChecked():
             command = ({'header': 'incubation'})
             command.update({'body': {
@@ -1003,8 +1287,23 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
 
         if self.checkBox_SampMod.isChecked():
             command = ({'header': 'sampling'})
-            command.update({'body': {
-                'sqt': float(self.lineEdit_SampQuietTime.text()),
+            command.update({'body': self.sampling_body()})
+            if self.actionRaw_Mode.isChecked():
+                command['body']['raw'] = True
+
+        if command['header'] == 'sampling' and self.actionAuto_Range.isChecked() and self.serial_connection:
+            autorange_worker = Worker(self.autorange, command)
+            autorange_worker.signals.DONE.connect(self.thread_completed)
+            autorange_worker.signals.OUTPUT.connect(self.response_handler)
+            autorange_worker.signals.ERROR.connect(self.error_report)
+            autorange_worker.signals.PROGRESS.connect(self.progress_status)
+            self.threadpool.start(autorange_worker)
+            return
+        self.send_command(command)
+
+    def sampling_body(self):
+        """Sampling settings of the panel"""
+        return {'sqt': float(self.lineEdit_SampQuietTime.text()),
                 'sn': int(self.lineEdit_NumbSamps.text()),
                 'st': float(self.lineEdit_SampTime.text()),
                 'si': float(self.lineEdit_SampIntrvl.text()),
@@ -1012,8 +1311,11 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
                 'pmr': str(self.comboBox_SampReadMod.currentText()),
                 'pv': float(self.lineEdit_PMV.text()),
                 'ag': int(self.lineEdit_ADCGain.text()),
-                'as': int(self.lineEdit_ADCSpd.text())}})
+                'as': int(self.lineEdit_ADCSpd.text())}
 
+    def send_command(self, command):
+        """Sends a command to the LucidSens on a worker thread, the response goes to response_handler"""
+        self.last_command = command
         jsnd_cmd = json.dumps(command)
         if self.serial_connection:
             run_worker = Worker(self.serial_sndr_recvr, jsnd_cmd)
@@ -1034,6 +1336,91 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
             msg.setIcon(QtWidgets.QMessageBox.Warning)
             msg.exec_()
 
+    def autorange(self, command, progress_callback=None):
+        """Pre-acquisition(s) of a few seconds, the sampling command comes back with the SiPM voltage and ADC gain to use"""
+        body = dict(command['body'])
+        for scan in range(AutoRange.MAX_SCANS):
+            resp = self.serial_sndr_recvr(json.dumps({'header': 'sampling', 'body': AutoRange.prescan_body(body)}), progress_callback)
+            if 'sampling' not in resp['header']:
+                return {'header': 'autorange failed', 'body': command}
+            choice = AutoRange.choose(RunIO.from_response(resp), body['pv'], body['ag'], reference=float(QSettings('AutoRange').value('FullScale', AutoRange.FULL_SCALE)),
+                                      breakdown=float(QSettings('AutoRange').value('Breakdown', AutoRange.BREAKDOWN_V)))
+            body.update(pv=choice['pv'], ag=choice['ag'])
+            if not choice['rescan']:
+                break
+        return {'header': 'autorange', 'body': dict(command, body=body), 'notes': dict(choice, scans=scan + 1)}
+
+    def device_ports(self):
+        """Serial ports of every connected LucidSens, the one of the current connection first"""
+        ports = [self.operator.port] if self.serial_connection else []
+        for port in lp.comports():
+            if any(name in str(port.device) for name in ['usbmodem', 'wch', 'SLAB']) or 'CP210x' in str(port):
+                device = str(port.device).replace('cu', 'tty')
+                if device not in ports:
+                    ports.append(device)
+        return ports
+
+    def parameter_sweep(self):
+        """Asks for the parameter grid and runs the sweep on every connected device in the background"""
+        if not self.serial_connection:
+            self.textBrowser.append(self.pen() + "No available connections to the LucidSens,\nPlease re-establish your connection first." + "</font>")
+            return
+        text, ok = QtWidgets.QInputDialog.getText(self, 'Parameter Sweep', f'Values of {", ".join(Sweep.PARAMETERS)} (e.g. pv=28,30,32; ag=1,64):',
+                                                  QtWidgets.QLineEdit.Normal, QSettings('Sweep').value('Grid', 'pv=28,30,32; ag=1,64'))
+        if not ok:
+            return
+        try:
+            bodies = Sweep.grid(self.sampling_body(), Sweep.parse_grid(text))
+        except ValueError as e:
+            self.textBrowser.append(self.pen(2, 'red') + str(e) + "</font>")
+            return
+        QSettings('Sweep').setValue('Grid', text)
+        self.textBrowser.append(self.pen() + f"Sweeping {len(bodies)} settings..." + "</font>")
+        sweep_worker = Worker(self.sweep, bodies)
+        sweep_worker.signals.DONE.connect(self.thread_completed)
+        sweep_worker.signals.OUTPUT.connect(self.response_handler)
+        sweep_worker.signals.ERROR.connect(self.error_report)
+        sweep_worker.signals.PROGRESS.connect(self.progress_status)
+        self.threadpool.start(sweep_worker)
+
+    def sweep(self, bodies, progress_callback=None):
+        """Runs the sweep, fanned out over the connected devices, the extra ports are only open during the sweep"""
+        operators = {self.operator.port: self.operator}
+        for port in self.device_ports()[1:]:
+            try:
+                operators[port] = serial.Serial(port, baudrate=115200)
+            except Exception as e:
+                print(e)
+        senders = {port: (lambda command, operator=operator: self.serial_sndr_recvr(command, None, operator)) for port, operator in operators.items()}
+        try:
+            result = Sweep.run_sweep(senders, bodies, self.archive, progress_callback.emit if progress_callback else None)
+        finally:
+            for operator in list(operators.values())[1:]:
+                operator.close()
+        return {'header': 'sweep', 'body': result}
+
+    def show_sweep(self, sweep):
+        """SNR and sensitivity heatmaps of a sweep over its first two swept parameters, the others are averaged"""
+        results = [result for result in sweep['results'] if result]
+        swept = [name for name in Sweep.PARAMETERS if len({result['settings'][name] for result in results}) > 1]
+        x, y = (swept + [name for name in Sweep.PARAMETERS if name not in swept])[:2]
+        if self.sweep_dock is None:
+            self.sweep_dock = QtWidgets.QDockWidget('Sweep', self)
+            self.sweep_view = pg.GraphicsLayoutWidget()
+            self.sweep_dock.setWidget(self.sweep_view)
+            self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.sweep_dock)
+        self.sweep_view.clear()
+        for metric, title in Sweep.METRICS.items():
+            xs, ys, values = Sweep.heatmap(results, x, y, metric)
+            PlotEngine.heatmap(self.sweep_view.addPlot(), xs, ys, values, x, y, title)
+        self.sweep_dock.setWindowTitle(f"Sweep {sweep['id']}")
+        self.sweep_dock.show()
+        scored = [result for result in results if np.isfinite(result['snr'])]
+        if scored:
+            best = max(scored, key=lambda result: result['snr'])
+            settings = ', '.join(f"{name} = {best['settings'][name]:g}" for name in Sweep.PARAMETERS)
+            self.textBrowser.append(self.pen() + f"Best SNR {best['snr']:.3g} at {settings} ({best['device']})." + "</font>")
+
     def about_us(self):
         """About Us"""
         msg = QtWidgets.QMessageBox()
@@ -1063,9 +1450,98 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
 
     def new(self):
         """Clears the graphicsView Window"""
+        self.batch_runs = []
+        self.reset_plot()
+
+    def reset_plot(self, tiles=None):
+        """Replaces the graphicsView content with a fresh plot and its curve manager, or with a grid of `tiles`"""
+        self.stop_live_view()
+        self.test_timer.stop()
+        self.run_source = None
         self.graphicsView.clear()
+        self.envelope = None
+        if tiles:
+            self.curves = PlotEngine.SmallMultiples(self.graphicsView, tiles)
+            self.p0 = self.curves.plot_item
+            return
         self.p0 = self.graphicsView.addPlot()
-        self.p0.showGrid(x=True, y=True, alpha=1)
+        self.p0.showAxis('right', show=True)
+        self.p0.showAxis('top', show=True)
+        self.curves = PlotEngine.CurveManager(self.p0)
+
+    def start_live_view(self, samples, window=60.0, capacity=100000, fps=20):
+        """Switches the plot to the scrolling live view, feed it through live_data()"""
+        self.reset_plot()
+        self.batch_runs = []
+        stream = None
+        if self.checkBox_DataSmth.isChecked() and self.comboBox_Smt.currentText() == 'Trianagular Moving Ave.':
+            stream = Processing.TriangularStream(int(self.comboBox_SGorders.currentText()), len(samples))
+        replicates = Analysis.ReplicateStream(QSettings('Processing').value('Outliers', 'mad')) if self.actionReplicate_Envelope.isChecked() and len(samples) > 1 else None
+        self.live = PlotEngine.LiveView(self.curves, samples, capacity, window, fps, on_full=self.archive_segment, stream=stream, replicates=replicates)
+
+    def live_monitor(self, checked):
+        """Starts/stops the live monitor: back-to-back short sampling segments streamed into the live view"""
+        if not checked:
+            self.monitoring = False
+            return
+        if not self.serial_connection or self.monitor_active:
+            # No connection, or the previous monitor is still finishing its last segment
+            self.actionLive_Monitor.blockSignals(True)
+            self.actionLive_Monitor.setChecked(False)
+            self.actionLive_Monitor.blockSignals(False)
+            self.statusbar.showMessage('No available connections to the LucidSens.' if not self.serial_connection else 'The live monitor is still stopping.')
+            return
+        body = dict(self.sampling_body(), sqt=0.0, st=float(QSettings('Live').value('Segment', 2.0)), raw=False)
+        self.last_command = {'header': 'sampling', 'body': body}
+        self.start_live_view([f'Sample #{i+1}' for i in range(body['sn'])])
+        self.monitoring = self.monitor_active = True
+        monitor_worker = Worker(self.monitor, self.last_command)
+        monitor_worker.signals.DONE.connect(self.thread_completed)
+        monitor_worker.signals.OUTPUT.connect(self.response_handler)
+        monitor_worker.signals.ERROR.connect(self.error_report)
+        monitor_worker.signals.PROGRESS.connect(self.progress_status)
+        self.threadpool.start(monitor_worker)
+
+    def monitor(self, command, progress_callback=None):
+        """
+        Sends the segment command until the monitor is stopped, every segment's rows go out through LIVE_ROWS timed
+        from the moment its command was sent, so the gaps of the serial handshake between segments stay on the axis
+        """
+        start = time.monotonic()
+        try:
+            while self.monitoring:
+                sent = time.monotonic() - start
+                resp = self.serial_sndr_recvr(json.dumps(command), progress_callback)
+                if 'sampling' not in resp['header'] or not self.monitoring:
+                    break
+                run = RunIO.from_response(resp)
+                self.LIVE_ROWS.emit((run.time + sent, run.data))
+        finally:
+            self.monitoring = self.monitor_active = False
+        return {'header': 'monitor', 'body': time.monotonic() - start}
+
+    def live_data(self, t, values):
+        """Appends streamed rows (time, one value per sample) to the live view"""
+        if self.live is not None:
+            self.live.append(t, values)
+
+    def stop_live_view(self):
+        """Leaves the live view, the rows still buffered are archived; a running live monitor is stopped with it"""
+        if self.monitoring:
+            self.monitoring = False
+            self.actionLive_Monitor.blockSignals(True)
+            self.actionLive_Monitor.setChecked(False)
+            self.actionLive_Monitor.blockSignals(False)
+        if self.live is not None:
+            self.live.stop()
+            self.live = None
+
+    def archive_segment(self, t, y):
+        """Archives a segment of live data pushed out of the ring buffer"""
+        try:
+            self.archive.add(RunIO.Run(t, y, self.live.samples, 'live_data'), settings=dict(self.last_command.get('body', {}), live=True))
+        except Exception as e:
+            print(e)
 
     def exit(self):
         """Exits the app"""
@@ -1077,99 +1553,577 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
         msg.setIcon(QtWidgets.QMessageBox.Warning)  # Information - Critical - Question
         msg.exec_()
         if msg.clickedButton() == msg.button(QtWidgets.QMessageBox.Yes):
+            self.save_session()
             sys.exit(0)
         elif msg.clickedButton() == msg.button(QtWidgets.QMessageBox.No):
             msg.close()
 
+    def closeEvent(self, event):
+        """Saves the session when the window is closed"""
+        self.save_session()
+        event.accept()
+
+    def save_session(self):
+        """Snapshots the plotted runs, the visible range and the processing settings for the next launch"""
+        state = {'batch': bool(self.batch_runs),
+                 'smoothing': self.checkBox_DataSmth.isChecked(),
+                 'algorithm': self.comboBox_Smt.currentIndex(),
+                 'order': self.comboBox_SGorders.currentIndex()}
+        if self.batch_runs:
+            runs = [RunIO.Run(*RunIO.minmax_decimate(run.time, run.data, 2000), run.samples, run.path) for run in self.batch_runs]
+            state['shown'] = [self.batch_list.item(i).checkState() == QtCore.Qt.Checked for i in range(len(runs))]
+            state['tile'] = self.batch_tile.isChecked()
+        elif self.run_source is not None:
+            runs = [RunIO.Run(self.run_source.overview_t, self.run_source.overview_y, self.run_source.samples, self.current_file)]
+        else:
+            runs = []
+        try:
+            Session.save_session(runs, self.p0.viewRange(), state)
+        except Exception as e:
+            print(e)
+
+    def restore_session(self):
+        """Restores the plot of the last session, full-resolution data is attached from the sidecar cache in the background"""
+        snapshot = Session.load_session()
+        if not snapshot or not snapshot[0]:
+            return
+        runs, view_range, state = snapshot
+        self.checkBox_DataSmth.setChecked(state.get('smoothing', False))
+        self.comboBox_Smt.setCurrentIndex(state.get('algorithm', 0))
+        self.comboBox_SGorders.setCurrentIndex(state.get('order', 0))
+        if state.get('batch'):
+            self.show_runs({'header': 'open batch', 'body': runs})
+            self.batch_list.blockSignals(True)
+            for i, shown in enumerate(state.get('shown', [])):
+                self.batch_list.item(i).setCheckState(QtCore.Qt.Checked if shown else QtCore.Qt.Unchecked)
+            self.batch_list.blockSignals(False)
+            self.batch_tile.setChecked(state.get('tile', False))
+            self.draw_batch()
+        else:
+            # The decimated snapshot has no path so it is never written back, the file stays the current one
+            run = runs[0]
+            snapshot = RunIO.Run(run.time, run.data, run.samples, '', {'snapshot': True})
+            self.show_run({'header': 'open', 'body': RunIO.RunView(snapshot, run.time, run.data)})
+            self.current_file = run.path
+            if run.path:
+                attach_worker = Worker(self.attach_run, run.path)
+                attach_worker.signals.OUTPUT.connect(self.attach_source)
+                attach_worker.signals.ERROR.connect(self.error_report)
+                self.threadpool.start(attach_worker)
+        self.p0.setRange(xRange=view_range[0], yRange=view_range[1], padding=0)
+        self.statusbar.showMessage('Last session is restored.')
+
+    def attach_run(self, path, progress_callback=None):
+        """Loads the sidecar of a restored run and builds its min/max pyramid (worker thread)"""
+        return {'header': 'open', 'body': self.cache.load(path)}
+
+    def attach_source(self, resp):
+        """Swaps the restored overview for the full-resolution run if it is still on display"""
+        source = resp['body']
+        if source is not None and getattr(self.run_source, 'run', None) is not None and self.run_source.run.meta.get('snapshot') \
+                and self.current_file == source.path:
+            self.run_source = source
+            self.display_source = self.processed(source)
+            self.refine_view()
+
     def save(self):
-        """Save Method"""
-        # this method needs to be modified after implementing an editable data-table
-        df = pd.read_csv(self.current_file)
-        df.to_csv(self.current_file, index=False)
+        """Save Method, writes the values edited in the data table back to the current file"""
+        if self.table_model is None or not self.table_model.dirty or not self.current_file or self.table_model.run.path != self.current_file \
+                or self.table_model.run.meta.get('snapshot'):
+            return
+        if self.current_file.endswith(RunCodec.EXTENSION):
+            RunCodec.save(self.current_file, self.table_model.run)
+        else:
+            RunIO.write_run(self.current_file, self.table_model.run)
+        self.table_model.dirty = False
 
     def save_as(self):
-        """Save as Method"""
-        save_as_file_obj = QtWidgets.QFileDialog.getSaveFileName(caption=__APPNAME__ + "QDialog Open File", filter="Text Files (*.csv)")
+        """Save as Method, exports either as CSV or as a compressed LucidSens archive file (.lsz)"""
+        save_as_file_obj = QtWidgets.QFileDialog.getSaveFileName(caption=__APPNAME__ + "QDialog Open File", filter="Text Files (*.csv);;LucidSens Archive (*.lsz)")
         if not save_as_file_obj[0]:
             return
-        if not self.current_file:
+        run = self.current_run() if self.run_source is not None else None
+        if run is None:
             return
+        try:
+            if save_as_file_obj[0].endswith(RunCodec.EXTENSION):
+                RunCodec.save(save_as_file_obj[0], run)
+            else:
+                RunIO.write_run(save_as_file_obj[0], run)
+        except Exception as e:
+            print(e)
+            self.textBrowser.append(self.pen(2, 'red') + "Failed to save the data file!" + "</font>")
 
-        df = pd.read_csv(self.current_file)
-        df.to_csv(save_as_file_obj[0], index=False)
+    def export_report(self):
+        """Renders the report of the current run (see Reports.py for batch/command-line rendering)"""
+        if self.run_source is None:
+            return
+        report_file_obj = QtWidgets.QFileDialog.getSaveFileName(caption=__APPNAME__ + "QDialog Export Report", filter="PNG Image (*.png);;PDF Document (*.pdf)")
+        if not report_file_obj[0]:
+            return
+        try:
+            run = self.processed_run(self.current_run())
+            settings = self.last_command.get('body') if self.current_file.endswith('latest_data.csv') else None
+            Reports.render_report(run, report_file_obj[0], settings)
+            self.statusbar.showMessage(f'Report exported: {report_file_obj[0]}')
+        except Exception as e:
+            print(e)
+            self.textBrowser.append(self.pen(2, 'red') + "Failed to export the report!" + "</font>")
+
+    def current_run(self):
+        """
+        Returns the whole current run as a RunIO.Run: with the table edits, the displayed run when it is held in memory,
+        otherwise the current file (from the sidecar cache when possible), never a decimated session snapshot
+        """
+        if self.table_model is not None and self.table_model.run.path == self.current_file:
+            return self.table_model.run
+        run = getattr(self.run_source, 'run', None)
+        if run is not None and not run.meta.get('snapshot'):
+            return run
+        if not self.current_file:
+            return None
+        try:
+            if self.current_file.endswith(RunCodec.EXTENSION):
+                return RunCodec.load(self.current_file)
+            cached = self.cache.load(self.current_file)
+            return cached.run if cached else RunIO.read_run(self.current_file)
+        except Exception as e:
+            print(e)
+            self.textBrowser.append(self.pen(2, 'red') + "Failed to read the data file!" + "</font>")
+            return None
 
     def open(self):
-        """Opens a CSV file"""
-        open_file_obj = QtWidgets.QFileDialog.getOpenFileName(caption=__APPNAME__ + "QDialog Open File", filter="Text Files (*.csv)")
+        """Opens a CSV file, the file is scanned in chunks on a worker thread"""
+        open_file_obj = QtWidgets.QFileDialog.getOpenFileName(caption=__APPNAME__ + "QDialog Open File", filter="Text Files (*.csv);;LucidSens Archive (*.lsz)")
         if not open_file_obj[0]:
             return
         # self.title = "".join((open_file_obj[0]).split('/')[-1:])
+        self.current_file = open_file_obj[0]
+        self.statusbar.showMessage('Loading...')
+        open_worker = Worker(self.load_run, self.current_file)
+        open_worker.signals.DONE.connect(self.thread_completed)
+        open_worker.signals.OUTPUT.connect(self.show_run)
+        open_worker.signals.ERROR.connect(self.error_report)
+        open_worker.signals.PROGRESS.connect(self.progress_status)
+        self.threadpool.start(open_worker)
+
+    def load_run(self, path, progress_callback=None):
+        """Loads a run from its sidecar, or scans the CSV file in chunks and writes the sidecar (worker thread)"""
         try:
-            self.current_file = open_file_obj[0]
-            df = pd.read_csv(self.current_file)
-            if len(df.columns) < 2:
-                msg = QtWidgets.QMessageBox()
-                QtTest.QTest.qWait(1000)
-                msg.setText("Seems like your dara is incomplete! faild to preview.")
-                self.textBrowser.append("Data file sounds incomplete.")
-                msg.setDefaultButton(QtWidgets.QMessageBox.Ok)
-                msg.setWindowTitle("Warning")
-                msg.exec_()
+            if path.endswith(RunCodec.EXTENSION):
+                return {'header': 'open', 'body': RunIO.RunView(RunCodec.load(path))}
+            source = self.cache.load(path)
+            if source is None:
+                reader = RunIO.ChunkedCSVReader(path)
+                sidecar = self.cache.writer(path)
+                try:
+                    reader.scan(progress_callback.emit if progress_callback else None, sidecar)
+                except Exception:
+                    sidecar.abort()
+                    raise
+                source = self.cache.load(path) or reader
+            return {'header': 'open', 'body': source}
+        except ValueError as e:
+            return {'header': 'open failed', 'body': str(e)}
+        except Exception as e:
+            print(e)
+            return {'header': 'open failed', 'body': 'Invalid file format. Are you sure file was created by the LucidSens!?'}
 
-            else:
-                colors = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'w', '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
-                time_idx = df['Time (s)'].tolist()
-                for i in range(1, len(df.columns)):
-                    self.plot_data(time_idx, df[f'Sample #{i}'].tolist(), color=colors[i-1], title=f'Sample #{i}')
-        except:
+    def show_run(self, resp):
+        """Plots the overview of a run, the visible range is redrawn at full resolution on zoom/pan"""
+        if 'failed' in resp['header']:
             msg = QtWidgets.QMessageBox()
-            msg.setText("Invalid file format. Are you sure file was created by the LucidSens!?")
+            msg.setText(resp['body'])
+            self.textBrowser.append("Data file sounds incomplete.")
             msg.setWindowTitle('File Error')
             msg.setDefaultButton(QtWidgets.QMessageBox.Ok)
             msg.setIcon(QtWidgets.QMessageBox.Warning)
             msg.exec_()
+            return
+        source = resp['body']
+        colors = PlotEngine.palette(len(source.samples))
+        # Every new run is tiled according to its own sample count, the View menu toggle only applies to the run on display
+        if source is not self.run_source:
+            self.actionTile_Samples.blockSignals(True)
+            self.actionTile_Samples.setChecked(len(source.samples) > self.tile_threshold)
+            self.actionTile_Samples.blockSignals(False)
+        tiles = source.samples if self.actionTile_Samples.isChecked() else None
+        if self.batch_runs or getattr(self.curves, 'slots', None) != tiles:
+            if self.batch_runs:
+                self.batch_runs = []
+                self.batch_dock.hide()
+            self.reset_plot(tiles)
+        self.run_source = source
+        self.display_source = self.processed(source)
+        self.current_file = self.run_source.path
+        self.curves.keep(self.run_source.samples)
+        for i, title in enumerate(self.run_source.samples):
+            self.plot_data(self.display_source.overview_t, self.display_source.overview_y[:, i], color=colors[i], title=title)
+        if self.actionShow_Legend.isChecked():
+            self.curves.show_legend(True)
+        self.draw_envelope()
+        self.p0.autoRange()
+        self.p0.disableAutoRange()
+        self.watch_view()
+
+    def redraw_run(self):
+        """Redraws the current run, e.g. after switching between overlaid and tiled samples"""
+        if self.run_source is not None:
+            self.show_run({'header': 'open', 'body': self.run_source})
+
+    def watch_view(self):
+        """Refines the current run whenever the visible range of the plot changes"""
+        try:
+            self.p0.sigXRangeChanged.disconnect(self.view_changed)
+        except TypeError:
+            pass
+        self.p0.sigXRangeChanged.connect(self.view_changed)
 
-    def import_table(self, dataFile):
-        self.tableWidget.setHorizontalHeaderLabels(['x', 'y'])
-        with open(dataFile[0]) as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
+    def view_changed(self, *args):
+        """Coalesces zoom/pan events, the view is refined at most once per frame (~60 fps)"""
+        self.view_timer.start(16)
 
-            for idx, cols in enumerate(csv_reader):
-                try:
-                    value_x = float(cols[0])
-                    item_x = QtWidgets.QTableWidgetItem()
-                    item_x.setData(QtCore.Qt.EditRole, value_x)
-                    self.tableWidget.setItem(idx, 0, item_x)
-                except Exception as e:
-                    print(e)
-                    print("Error is handled: String values were removed from the table." + '\n')
+    def refine_view(self):
+        """Redraws the opened run at the resolution of the visible range"""
+        if self.run_source is None:
+            return
+        x0, x1 = self.p0.viewRange()[0]
+        t, y = self.display_source.view(x0, x1, max(int(self.p0.vb.width()), 100))
+        for i, title in enumerate(self.run_source.samples):
+            self.curves.set_data(title, t, y[:, i])
+        if self.envelope is not None:
+            self.envelope.set_data(*self.envelope_source.view(x0, x1, max(int(self.p0.vb.width()), 100)))
+
+    def draw_envelope(self):
+        """Plots the replicate mean \u00b1 SD of the displayed run (overlaid samples only), or removes it"""
+        if self.envelope is not None:
+            self.envelope.remove()
+            self.envelope = self.envelope_source = None
+        if (self.run_source is None or not self.actionReplicate_Envelope.isChecked() or len(self.run_source.samples) < 2
+                or isinstance(self.curves, PlotEngine.SmallMultiples)):
+            return
+        run = self.display_source.run if hasattr(self.display_source, 'run') else self.processed_run(self.current_run())
+        t, band = Analysis.envelope(run, QSettings('Processing').value('Outliers', 'mad'))
+        self.envelope_source = RunIO.RunView(RunIO.Run(t, band, ['lower', 'mean', 'upper']))
+        self.envelope = PlotEngine.Envelope(self.p0)
+        self.envelope.set_data(self.envelope_source.overview_t, self.envelope_source.overview_y)
+
+    def open_multiple(self):
+        """Opens several CSV files at once, files are parsed in parallel on a worker thread"""
+        open_files_obj = QtWidgets.QFileDialog.getOpenFileNames(caption=__APPNAME__ + "QDialog Open Files", filter="Text Files (*.csv)")
+        if not open_files_obj[0]:
+            return
+        self.statusbar.showMessage('Loading...')
+        batch_worker = Worker(self.load_runs, open_files_obj[0])
+        batch_worker.signals.DONE.connect(self.thread_completed)
+        batch_worker.signals.OUTPUT.connect(self.show_runs)
+        batch_worker.signals.ERROR.connect(self.error_report)
+        batch_worker.signals.PROGRESS.connect(self.progress_status)
+        self.threadpool.start(batch_worker)
+
+    def load_runs(self, paths, progress_callback=None):
+        """Parses a batch of run files on a process pool (worker thread)"""
+        runs = RunIO.read_runs(paths, progress_callback=progress_callback.emit if progress_callback else None, cache=self.cache)
+        if not runs:
+            return {'header': 'open failed', 'body': 'None of the selected files could be read.'}
+        return {'header': 'open batch', 'body': runs}
+
+    def show_runs(self, resp):
+        """Lists the opened batch with per-file toggles and plots it"""
+        if 'failed' in resp['header']:
+            self.show_run(resp)
+            return
+        self.batch_runs = resp['body']
+        self.run_source = None
+        if self.batch_dock is None:
+            self.batch_dock = QtWidgets.QDockWidget('Runs', self)
+            widget = QtWidgets.QWidget()
+            layout = QtWidgets.QVBoxLayout(widget)
+            self.batch_tile = QtWidgets.QCheckBox('Tile')
+            self.batch_tile.stateChanged.connect(self.draw_batch)
+            self.batch_list = QtWidgets.QListWidget()
+            self.batch_list.itemChanged.connect(self.batch_toggled)
+            layout.addWidget(self.batch_tile)
+            layout.addWidget(self.batch_list)
+            self.batch_dock.setWidget(widget)
+            self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.batch_dock)
+        self.batch_list.blockSignals(True)
+        self.batch_list.clear()
+        for run in self.batch_runs:
+            item = QtWidgets.QListWidgetItem(run.name)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Checked)
+            item.setToolTip(run.path)
+            self.batch_list.addItem(item)
+        self.batch_list.blockSignals(False)
+        self.batch_dock.show()
+        self.draw_batch()
+
+    def draw_batch(self):
+        """Plots the checked runs of the batch aligned on time, overlaid in one plot or tiled with linked axes"""
+        styles = [QtCore.Qt.SolidLine, QtCore.Qt.DashLine, QtCore.Qt.DotLine, QtCore.Qt.DashDotLine]
+        tiled = self.batch_tile.isChecked()
+        shown = [i for i in range(len(self.batch_runs)) if self.batch_list.item(i).checkState() == QtCore.Qt.Checked]
+        self.graphicsView.clear()
+        self.batch_curves = [[] for _ in self.batch_runs]
+        if tiled:
+            cols = int(np.ceil(np.sqrt(len(shown)))) or 1
+            plots = {}
+            for n, i in enumerate(shown):
+                plots[i] = self.graphicsView.addPlot(row=n // cols, col=n % cols, title=self.batch_runs[i].name)
+                if n:
+                    plots[i].setXLink(plots[shown[0]])
+                    plots[i].setYLink(plots[shown[0]])
+        else:
+            plot = self.graphicsView.addPlot()
+            plot.addLegend()
+            plots = {i: plot for i in range(len(self.batch_runs))}
+        for i, plot in plots.items():
+            plot.showGrid(x=True, y=True, alpha=1)
+            run = self.processed_run(self.batch_runs[i])
+            t, y = RunIO.minmax_decimate(run.aligned_time(), run.data, 2000)
+            pen_color = pg.intColor(i, hues=len(self.batch_runs))
+            for j in range(y.shape[1]):
+                curve = plot.plot(x=t, y=y[:, j], pen=pg.mkPen(color=pen_color, width=2, style=styles[j % len(styles)]), name=None if j else run.name)
+                curve.setVisible(i in shown)
+                self.batch_curves[i].append(curve)
+        self.p0 = next(iter(plots.values())) if plots else self.graphicsView.addPlot()
+        self.p0.setLabel('bottom', 'Time (s)')
+        self.p0.setLabel('left', 'Counts (a.u.)')
+
+    def batch_toggled(self, item):
+        """Shows/hides a run of the batch"""
+        if self.batch_tile.isChecked():
+            self.draw_batch()
+            return
+        for curve in self.batch_curves[self.batch_list.row(item)]:
+            curve.setVisible(item.checkState() == QtCore.Qt.Checked)
 
-                try:
-                    value_y = float(cols[1])
-                    item_y = QtWidgets.QTableWidgetItem()
-                    item_y.setData(QtCore.Qt.EditRole, value_y)
-                    self.tableWidget.setItem(idx, 1, item_y)
-                except Exception as e:
-                    print(e)
-                    print("Error is handled: String values were removed from the table." + '\n')
-
-        # if self.tableWidget.currentItem() is None:
-        #     self.tableWidget.removeRow(self.tableWidget.currentRow())
-        # print(self.tableWidget.rowCount())
-        self.tableWidget.setRowCount(idx + 1)
-        self.setText("Datafile is imported to the table.")
+    def import_table(self):
+        """Shows the current run in the data table, a view over the run's arrays (see TableModel.RunTableModel)"""
+        if self.run_source is None:
+            return
+        run = self.current_run()
+        if run is None:
+            self.statusbar.showMessage('The full-resolution data of this plot is not available.')
+            return
+        self.table_model = TableModel.RunTableModel(run)
+        self.table_model.EDITED.connect(self.table_edited)
+        if self.table_dock is None:
+            self.table_dock = QtWidgets.QDockWidget('Data', self)
+            widget = QtWidgets.QWidget()
+            layout = QtWidgets.QVBoxLayout(widget)
+            self.table_filter = QtWidgets.QLineEdit()
+            self.table_filter.setPlaceholderText('Filter, e.g. Sample #1 > 2.5')
+            self.table_filter.returnPressed.connect(self.filter_table)
+            self.table_view = QtWidgets.QTableView()
+            self.table_view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+            self.table_view.verticalHeader().setDefaultSectionSize(20)
+            layout.addWidget(self.table_filter)
+            layout.addWidget(self.table_view)
+            self.table_dock.setWidget(widget)
+            self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.table_dock)
+        self.table_view.setModel(self.table_model)
+        self.table_view.setSortingEnabled(True)
+        self.table_view.sortByColumn(0, QtCore.Qt.AscendingOrder)
+        self.table_dock.show()
+        self.statusbar.showMessage("Datafile is imported to the table.")
+
+    def filter_table(self):
+        """Applies the filter typed above the data table, an empty filter shows every row"""
+        text = self.table_filter.text().strip()
+        if not text:
+            self.table_model.clear_filter()
+            return
+        match = re.match(r'(.+?)\s*(<=|>=|==|!=|<|>)\s*(\S+)$', text)
+        try:
+            self.table_model.set_filter(self.table_model.headers.index(match.group(1)), match.group(2), float(match.group(3)))
+        except (AttributeError, ValueError):
+            self.statusbar.showMessage(f"Invalid filter: {text}")
+
+    def table_edited(self, col):
+        """Keeps the plot in sync with the values edited in the data table, only the edited column is rebinned"""
+        run = self.table_model.run
+        if getattr(self.run_source, 'run', None) is run:
+            self.run_source.update(col - 1)
+        elif self.run_source is not None and run.path == self.current_file:
+            self.run_source = RunIO.RunView(run)
+        else:
+            return
+        self.display_source = self.processed(self.run_source)
+        self.refine_view()
+
+    def rederive(self):
+        """Recomputes the current run from its archived raw reads with the Raw Filter and a new number of reads per point"""
+        run_id = self.run_source.run.meta.get('id') if self.run_source is not None and hasattr(self.run_source, 'run') else None
+        raw_entries = self.archive.entries(lambda entry: run_id and entry.get('raw_of') == run_id)
+        if not raw_entries:
+            self.statusbar.showMessage('No raw reads are archived for this run.')
+            return
+        factor, ok = QtWidgets.QInputDialog.getInt(self, 'Re-derive', 'Raw reads per point:', raw_entries[-1]['settings'].get('r2avg', 10), 1, 101)
+        if not ok:
+            return
+        raw = self.archive.load(raw_entries[-1]['id'])
+        run = Processing.rederive(raw, factor, QSettings('Processing').value('RawFilter', 'mean'))
+        # Same blank correction as the archived run; the result has no file, it stays in memory until Save As
+        entry = self.archive.entries(lambda entry: entry['id'] == run_id)[0]
+        meta = dict(run.meta, id=run_id, settings=entry['settings'])
+        data = run.data
+        if entry.get('blank_subtracted'):
+            offset = self.references.offset(entry.get('device', ''), entry['settings'], data.shape)
+            if offset is not None:
+                data = data - offset
+                meta['blank'] = References.reference_key(entry.get('device', ''), entry['settings'])
+            else:
+                self.textBrowser.append(self.pen(2, 'orange') + "The blank reference of this run is gone, raw counts are shown." + "</font>")
+        self.show_run({'header': 'open', 'body': RunIO.RunView(RunIO.Run(run.time, data, run.samples, '', meta))})
+
+    def show_features(self):
+        """Lists the kinetics features and quality scores of the current run next to the plot"""
+        run = self.current_run() if self.run_source is not None else None
+        if run is None:
+            return
+        self.fill_features(run.samples, dict(Analysis.features(run), **Analysis.quality(run)))
+
+    def fill_features(self, samples, features, title='Features'):
+        """Fills the Features dock: one row per sample, one column per feature (or fitted parameter)"""
+        if self.features_dock is None:
+            self.features_dock = QtWidgets.QDockWidget('Features', self)
+            self.features_table = QtWidgets.QTableWidget()
+            self.features_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+            self.features_dock.setWidget(self.features_table)
+            self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.features_dock)
+        # Replicate statistics of every column below the samples, the rejected outliers are shown in red
+        stats, rejected = Analysis.feature_stats(features, QSettings('Processing').value('Outliers', 'mad')) if len(samples) > 2 else ({}, {})
+        self.features_table.clear()
+        self.features_table.setRowCount(len(samples) + (len(Analysis.STATISTICS) if stats else 0))
+        self.features_table.setColumnCount(len(features))
+        self.features_table.setHorizontalHeaderLabels(list(features))
+        self.features_table.setVerticalHeaderLabels(list(samples) + (Analysis.STATISTICS if stats else []))
+        for col, (label, values) in enumerate(features.items()):
+            for row, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(f'{value:.4g}')
+                if stats and rejected[label][row] and np.isfinite(value):
+                    item.setForeground(QtGui.QBrush(QtGui.QColor('red')))
+                    item.setToolTip('Outlier, left out of the replicate statistics')
+                self.features_table.setItem(row, col, item)
+            for row, name in enumerate(Analysis.STATISTICS if stats else []):
+                self.features_table.setItem(len(samples) + row, col, QtWidgets.QTableWidgetItem(f'{stats[label][name]:.4g}'))
+        self.features_table.resizeColumnsToContents()
+        self.features_dock.setWindowTitle(title)
+        self.features_dock.show()
+
+    def archive_features(self):
+        """Computes the features of every archived run in the background"""
+        features_worker = Worker(self.update_archive_features)
+        features_worker.signals.DONE.connect(self.thread_completed)
+        features_worker.signals.ERROR.connect(self.error_report)
+        features_worker.signals.PROGRESS.connect(self.progress_status)
+        self.threadpool.start(features_worker)
+
+    def degraded_runs(self):
+        """Lists the archived runs scored below a minimum SNR, runs archived before scoring need Update Archive Features"""
+        min_snr, ok = QtWidgets.QInputDialog.getDouble(self, 'Find Degraded Runs', 'Minimum SNR:', float(QSettings('Processing').value('MinSNR', 10)), 0, 1e6, 1)
+        if not ok:
+            return
+        QSettings('Processing').setValue('MinSNR', min_snr)
+        found = Analysis.degraded(self.archive, min_snr)
+        self.textBrowser.append(self.pen() + f"{len(found)} archived run(s) below SNR {min_snr:g}" + "</font>")
+        for entry, snr in found:
+            self.textBrowser.append(self.pen(2, 'orange') + f"{entry['id']} ({entry['name']}): SNR {snr:.3g}" + "</font>")
+
+    def update_archive_features(self, progress_callback=None):
+        return {'header': 'features', 'body': Analysis.archive_features(self.archive, progress_callback=progress_callback.emit if progress_callback else None)}
+
+    def fit_decay(self, model):
+        """Fits a decay model to every sample of the current run, warm started from its last fit"""
+        run = self.current_run() if self.run_source is not None else None
+        if run is None:
+            return
+        run_id = run.meta.get('id')
+        key = (run_id or run.path, model)
+        previous = self.fit_cache.get(key)
+        if previous is None and run_id:
+            entries = self.archive.entries(lambda entry: entry['id'] == run_id)
+            previous = entries[0].get('fits', {}).get(model) if entries else None
+        fits = Fitting.fit_run(run, model, previous)
+        self.fit_cache[key] = fits
+        if run_id:
+            self.archive.update(run_id, fits=dict(self.archive.entries(lambda entry: entry['id'] == run_id)[0].get('fits', {}), **{model: fits}))
+        table = {}
+        for name in Fitting.MODELS[model][0]:
+            table[name] = np.array([fit['params'][name] for fit in fits])
+            table[f'{name} \u00b1'] = np.array([np.nan if fit['ci'][name] is None else fit['ci'][name] for fit in fits])
+        self.fill_features(run.samples, table, 'Decay Fit')
+
+    def archive_fits(self):
+        """Refits every archived run on a process pool in the background"""
+        model, ok = QtWidgets.QInputDialog.getItem(self, 'Refit Archive', 'Model:', list(Fitting.MODELS), 0, False)
+        if not ok:
+            return
+        fits_worker = Worker(self.update_archive_fits, model)
+        fits_worker.signals.DONE.connect(self.thread_completed)
+        fits_worker.signals.ERROR.connect(self.error_report)
+        fits_worker.signals.PROGRESS.connect(self.progress_status)
+        self.threadpool.start(fits_worker)
+
+    def update_archive_fits(self, model, progress_callback=None):
+        return {'header': 'fits', 'body': Fitting.fit_archive(self.archive.root, model=model, progress_callback=progress_callback.emit if progress_callback else None)}
+
+    def archived_entry(self):
+        """Archive index entry of the current run, None when it was not archived"""
+        run_id = self.run_source.run.meta.get('id') if self.run_source is not None and hasattr(self.run_source, 'run') else None
+        entries = self.archive.entries(lambda entry: run_id and entry['id'] == run_id)
+        return entries[0] if entries else None
+
+    def mark_standards(self):
+        """Records the known concentration of every sample of the current (archived) run, making it a calibration standard"""
+        entry = self.archived_entry()
+        if entry is None:
+            self.statusbar.showMessage('Only archived runs can be marked as standards.')
+            return
+        current = ', '.join('' if c is None else f'{c:g}' for c in entry.get('concentrations') or [])
+        text, ok = QtWidgets.QInputDialog.getText(self, 'Mark Standards', 'Concentration of each sample, comma separated (empty for the unknowns):',
+                                                  QtWidgets.QLineEdit.Normal, current)
+        if not ok:
+            return
+        try:
+            concentrations = [float(c) if c.strip() else None for c in text.split(',')] if text.strip() else []
+        except ValueError:
+            self.textBrowser.append(self.pen(2, 'red') + "Concentrations must be numbers!" + "</font>")
+            return
+        self.archive.update(entry['id'], concentrations=concentrations[:len(entry.get('samples', concentrations))] or None)
+        self.statusbar.showMessage(f'{sum(c is not None for c in concentrations)} standard(s) recorded.')
+
+    def build_calibration(self):
+        """Fits the calibration curve of the current run's device and settings from all the archived standards sharing them"""
+        entry = self.archived_entry()
+        if entry is None:
+            self.statusbar.showMessage('Open an archived run to calibrate its settings.')
+            return
+        model, ok = QtWidgets.QInputDialog.getItem(self, 'Build Calibration', 'Model:', list(Calibration.MODELS), 1, False)
+        if not ok:
+            return
+        feature, ok = QtWidgets.QInputDialog.getItem(self, 'Build Calibration', 'Feature:', Calibration.FEATURES, 0, False)
+        if not ok:
+            return
+        try:
+            fit = self.calibrations.build(self.archive, entry.get('device', ''), entry.get('settings', {}), model, feature)
+        except Exception as e:
+            print(e)
+            self.textBrowser.append(self.pen(2, 'red') + f"Calibration failed: {e}" + "</font>")
+            return
+        params = ', '.join(f'{name} = {value:.4g}' for name, value in fit['params'].items())
+        self.textBrowser.append(self.pen() + f"{model} calibration on {fit['n']} standards: {params}" + "</font>")
+        run = self.current_run()
+        if run is None:
+            return
+        features = Analysis.features(run)
+        self.fill_features(run.samples, dict(features, Concentration=Calibration.predict(fit, features[feature])))
 
     def plot_data(self, x, y, color='w', title='Data'):
-        """Handles data-plotting"""
-        data_x, data_y = x, y
-        self.p0.addLegend(offset=(548,8))
-        self.p0.plot(x=data_x, y=data_y, pen=pg.mkPen(color=color, width=2), name=title)
-        self.p0.showGrid(x=True, y=True, alpha=1)
-        _theme = QSettings('Theme').value('Theme')
-        if _theme:
-            color = 'black' if _theme in ['Fusion', 'Light-Classic'] else 'white'
-        self.p0.setLabel('bottom', 'Time (s)', **{'color': color, 'font-size': '12px'})
-        self.p0.setLabel('left', 'Counts (a.u.)', **{'color': color, 'font-size': '12px'})
+        """Handles data-plotting, the curve of each sample is created once and then only updated"""
+        return self.curves.plot(title, x, y, color=color, title=title)
 
     def stop(self):
         """Kill switch to interrupt the on-going operation on the LucidSens"""
@@ -1250,6 +2204,7 @@ class Form(QtWidgets.QMainWindow, mainWindowGUI.Ui_MainWindow):
                 self.prefs.close()
             else:
                 pass
+        self.curves.style()
         self.prefs.close()
 
     def preferences_reject(self):
@@ -1354,5 +2309,6 @@ if __name__ == '__main__':
             pass
 
     form.show()
+    QtCore.QTimer.singleShot(0, form.restore_session)
     # splash.finish(form)
     app.exec_()
\ No newline at end of file